@@ -0,0 +1,52 @@
+# Atomic replacement of small files.
+#
+# Refs, indexes and spooled mails must never be seen half-written, so
+# they are written to a temporary file in the same directory and then
+# renamed over the real one.  The temporary file comes from mkstemp, so
+# that threads (or processes) writing the same path at once can't
+# clobber each other's temporary files.  Temporary files end in ".tmp",
+# for whoever cleans up a directory to recognise them.
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+TMP_SUFFIX = '.tmp'
+
+
+@contextmanager
+def atomic_file(path, mode='wb', fsync=False, makedirs=False, **kwargs):
+    """
+    Yield a file, opened with mode and kwargs, to write the new contents
+    of path to.  path is replaced by it if the block completes, and left
+    alone if it raises.  With fsync=True the data is on disk before the
+    rename; with makedirs=True, path's directory is created if need be.
+    """
+    directory = os.path.dirname(path) or '.'
+    if makedirs:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=directory,
+                                   prefix=os.path.basename(path) + '.',
+                                   suffix=TMP_SUFFIX)
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmppath, path)
+    except BaseException:
+        try:
+            os.unlink(tmppath)
+        except OSError:
+            pass
+        raise
+
+
+def write_atomically(path, data, fsync=False, makedirs=False):
+    """
+    Replace the file at path with data (bytes or str).
+    """
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    with atomic_file(path, mode, fsync=fsync, makedirs=makedirs) as f:
+        f.write(data)
@@ -0,0 +1,107 @@
+# In-process cache of parsed baselines, sums and xfail sets.
+#
+# Consecutive builds of a builder/branch mostly evaluate against the
+# same baseline, previous sum and xfail list, so the master keeps the
+# parsed versions around instead of reading and parsing them again for
+# every build.  Each entry remembers the size, mtime and inode of the
+# files it was loaded from and is reloaded as soon as any of them
+# changes; writers in this process can also invalidate() entries
+# directly.  Memory is bounded by evicting the least recently used
+# entries once the total weight (the number of tests held) goes over
+# max_weight.
+#
+# The cache may be used from several threads at once.
+
+import os
+import threading
+from collections import OrderedDict
+
+
+def _signature(paths):
+    result = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            result.append(None)
+        else:
+            result.append((st.st_size, st.st_mtime_ns, st.st_ino))
+    return tuple(result)
+
+
+def _weight(value):
+    try:
+        return max(1, len(value))
+    except TypeError:
+        return 1
+
+
+class BaselineCache:
+    """
+    LRU cache of parsed results, keyed by e.g. (builder, branch, kind).
+    Cached values are shared, so callers must not modify them.
+    """
+    def __init__(self, max_weight=2000000):
+        self.max_weight = max_weight
+        self.weight = 0
+        # key -> (signature, value, weight), least recently used first.
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, paths, load):
+        """
+        Return the value cached for key, provided none of the files at
+        paths have changed since it was loaded; otherwise call load()
+        and cache what it returns.
+        """
+        # Take the signature before loading, so that a file changing
+        # while we load it makes the next lookup miss.
+        signature = _signature(paths)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+
+        # Don't hold the lock while loading, which may be slow.
+        value = load()
+        weight = _weight(value)
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (signature, value, weight)
+            self.weight += weight
+            while self.weight > self.max_weight and len(self.entries) > 1:
+                _, (_, _, evicted) = self.entries.popitem(last=False)
+                self.weight -= evicted
+                self.evictions += 1
+        return value
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def invalidate(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.weight = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'weight': self.weight}
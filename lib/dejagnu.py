@@ -18,63 +18,495 @@
 # Shamelessly adapted from jamais-vu by David Malcolm
 # https://github.com/davidmalcolm/jamais-vu/blob/master/jv
 #
+import hashlib
+import io
+import mmap
 import os
+import json
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import quoteattr
+
+from atomicfile import atomic_file
 
 OUTCOMES = 'FAIL PASS XFAIL KFAIL XPASS KPASS UNTESTED UNRESOLVED UNSUPPORTED'.split()
 
+# Result lines look like 'OUTCOME: testname'; we dispatch on the text
+# before the first ': ' rather than trying every prefix in turn.
+_OUTCOME_SET = frozenset(OUTCOMES)
+
+# A result line has its ': ' no later than this offset, so there's no
+# point searching the rest of a (possibly very long) line for it.
+_OUTCOME_SEP_END = max(len(outcome) for outcome in OUTCOMES) + 2
+
+# Same, for scanning raw bytes.
+_OUTCOME_BYTES = frozenset(outcome.encode('ascii') for outcome in OUTCOMES)
+
+
+############################################################################
+# Parsing engine
+############################################################################
+def iter_result_lines(lines):
+    """
+    Generate (outcome, testname, lineno) for every test result in an
+    iterable of lines of dejagnu output.  lineno is 1-based.
+    """
+    outcomes = _OUTCOME_SET
+    sep_end = _OUTCOME_SEP_END
+    for lineno, line in enumerate(lines, 1):
+        sep = line.find(': ', 0, sep_end)
+        if sep < 0:
+            continue
+        outcome = line[:sep]
+        if outcome in outcomes:
+            yield outcome, line[sep + 2:].rstrip(), lineno
+
+
+def iter_results(path):
+    """
+    Generate (outcome, testname, lineno) for every test result in the
+    .sum or .log file at path, in a single streaming pass.
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        yield from iter_result_lines(f)
+
+
+class ResultStream:
+    """
+    Incremental parser for dejagnu output that arrives a piece at a
+    time, e.g. from a running testsuite.
+
+    feed() takes arbitrary chunks of text and feed_line() whole lines;
+    both return the list of (outcome, testname, lineno) results they
+    completed, as iter_result_lines would.  A partial last line is held
+    back until the next chunk, or finish().  counts has the running
+    number of results per outcome.
+    """
+    def __init__(self):
+        self.lineno = 0
+        self.counts = dict((outcome, 0) for outcome in OUTCOMES)
+        self._partial = ''
+
+    def _parse(self, lines):
+        results = list(iter_result_lines(lines))
+        counts = self.counts
+        lineno = self.lineno
+        for i, (outcome, testname, n) in enumerate(results):
+            counts[outcome] += 1
+            results[i] = (outcome, testname, lineno + n)
+        self.lineno += len(lines)
+        return results
+
+    def feed(self, chunk):
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        return self._parse(lines)
+
+    def feed_line(self, line):
+        return self._parse([line])
+
+    def finish(self):
+        partial = self._partial
+        self._partial = ''
+        return self._parse([partial]) if partial else []
+
+
+def _columns(results):
+    testnames = []
+    outcomes = array('B')
+    lineidxs = array('I')
+    codes = OUTCOME_CODES
+    for outcome, testname, lineno in results:
+        testnames.append(testname)
+        outcomes.append(codes[outcome])
+        lineidxs.append(lineno - 1)
+    return testnames, outcomes, lineidxs
+
+
+def parse_columns(path):
+    """
+    Parse the file at path into (testnames, outcome codes, line indices)
+    columns, suitable for DejaFile.load_columns.  This is what the
+    TestRun loader runs in its worker processes, so it returns plain
+    picklable objects.
+    """
+    return _columns(iter_results(path))
+
+
+def parse_columns_text(text):
+    """
+    Like parse_columns, for the text of a .sum or .log file.  Lines are
+    split as when reading the file.
+    """
+    return _columns(iter_result_lines(io.StringIO(text, newline=None)))
+
+
+# Cache of parsed .sum files (see resultcache.ResultsCache), or None.
+results_cache = None
+
+
+def set_results_cache(cache):
+    """
+    Have SumFile and TestRun load .sum files through cache, which must
+    provide load(path), get_columns(path) and get_text_columns(text) as
+    resultcache.ResultsCache does, and be picklable.  Pass None to stop caching.
+    """
+    global results_cache
+    results_cache = cache
+
+
+def find_sum_files(path):
+    """
+    Generate the paths of all .sum files below the directory path, in
+    a deterministic order: each directory's files by name, then its
+    subdirectories by name.
+    """
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir():
+            subdirs.append(entry.path)
+        elif entry.name.endswith('.sum'):
+            yield entry.path
+    for subdir in subdirs:
+        yield from find_sum_files(subdir)
+
 
 ############################################################################
 # .sum and .log files
 ############################################################################
+class NameTable:
+    """
+    Interning table mapping test names to small integer IDs.
+
+    A TestRun shares one table between all of its files, and several
+    runs can share one too, so that each distinct test name is stored
+    once however many files mention it.
+    """
+    def __init__(self):
+        self.name_to_id = {}
+        self.names = []
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        nameid = self.name_to_id.get(name)
+        if nameid is None:
+            nameid = self.name_to_id[name] = len(self.names)
+            self.names.append(name)
+        return nameid
+
+
+# Compact code for each outcome, as stored in DejaFile.outcomes.
+OUTCOME_CODES = dict((outcome, code) for code, outcome in enumerate(OUTCOMES))
+
+
 class DejaFile:
     """
     Output from dejagnu, either a .log or a .sum file
+
+    Results are stored as three parallel arrays, one entry per result
+    line: the test name's ID in self.names, the outcome's code in
+    OUTCOME_CODES and the line index.  The testname_to_outcome,
+    testname_to_lineidx and outcome_to_testnames dicts are built from
+    them, each only if it is asked for; find(), summarize() and
+    TestRun.dump() work from the arrays and build none of them.
+
+    With lazy=True the file isn't parsed until its results are needed.
     """
-    def __init__(self, path):
+    def __init__(self, path, names=None, lazy=False):
         self.path = path
+        self.names = names if names is not None else NameTable()
+
+        self.nameids = array('I')
+        self.outcomes = array('B')
+        self.lineidxs = array('I')
+
+        # Views built so far, by name:
+        self._views = {}
+
+        # Parse the file and fill in the above arrays:
+        self._parsed = False
+        if not lazy:
+            self.parse()
+
+    def parse(self):
+        if not self._parsed:
+            self._parsed = True
+            self.add_results(iter_results(self.path))
+
+    def load_columns(self, testnames, outcomes, lineidxs):
+        """
+        Fill in results from parse_columns(self.path), instead of
+        parsing the file here.
+        """
+        self._parsed = True
+        self.nameids.extend(map(self.names.intern, testnames))
+        self.outcomes.extend(outcomes)
+        self.lineidxs.extend(lineidxs)
+        self._views = {}
+
+    def add_results(self, results):
+        """
+        Record (outcome, testname, lineno) tuples, as generated by
+        iter_results.
+        """
+        intern = self.names.intern
+        codes = OUTCOME_CODES
+        nameids = self.nameids
+        outcomes = self.outcomes
+        lineidxs = self.lineidxs
+        for outcome, testname, lineno in results:
+            nameids.append(intern(testname))
+            outcomes.append(codes[outcome])
+            lineidxs.append(lineno - 1)
+        self._views = {}
+
+    def iter_entries(self):
+        """
+        Generate (testname, outcome, lineidx) for every result, in file
+        order.
+        """
+        self.parse()
+        names = self.names.names
+        for nameid, code, lineidx in zip(self.nameids, self.outcomes,
+                                         self.lineidxs):
+            yield names[nameid], OUTCOMES[code], lineidx
+
+    def _view(self, name, build):
+        view = self._views.get(name)
+        if view is None:
+            self.parse()
+            view = self._views[name] = build()
+        return view
 
-        # Mapping from test name to outcome
-        # e.g. from 'libffi.call/closure_fn0.c -O0 -W -Wall (test for excess errors)'
-        # to 'PASS'
-        self.testname_to_outcome = {}
-
-        # Mapping from outcome to set of test names
-        self.outcome_to_testnames = {}
-        for outcome in OUTCOMES:
-            self.outcome_to_testnames[outcome] = set()
-
-        # Mapping from test name to line index
-        self.testname_to_lineidx = {}
-
-        # Parse the file and build the above dicts:
-        for idx, line in enumerate(open(self.path)):
-            for outcome in OUTCOMES:
-                prefix = '{}: '.format(outcome)
-                if line.startswith(prefix):
-                    testname = line[len(prefix):].rstrip()
-                    self.testname_to_outcome[testname] = outcome
-                    self.testname_to_lineidx[testname] = idx
-                    self.outcome_to_testnames[outcome].add(testname)
-                    break  # OUTCOMES loop
+    @property
+    def testname_to_outcome(self):
+        """
+        Mapping from test name to outcome, e.g. from
+        'libffi.call/closure_fn0.c -O0 -W -Wall (test for excess errors)'
+        to 'PASS'.
+        """
+        def build():
+            names = self.names.names
+            return {names[nameid]: OUTCOMES[code]
+                    for nameid, code in zip(self.nameids, self.outcomes)}
+        return self._view('testname_to_outcome', build)
+
+    @property
+    def testname_to_lineidx(self):
+        def build():
+            names = self.names.names
+            return {names[nameid]: lineidx
+                    for nameid, lineidx in zip(self.nameids, self.lineidxs)}
+        return self._view('testname_to_lineidx', build)
+
+    @property
+    def outcome_to_testnames(self):
+        def build():
+            names = self.names.names
+            return {outcome: set(names[nameid] for nameid in nameids)
+                    for outcome, nameids in self.nameids_by_outcome().items()}
+        return self._view('outcome_to_testnames', build)
+
+    def nameids_by_outcome(self):
+        """
+        Return a dict from each outcome to the set of IDs of the tests
+        with that outcome (a test can appear under several).  Not kept.
+        """
+        self.parse()
+        result = dict((outcome, set()) for outcome in OUTCOMES)
+        by_code = [result[outcome] for outcome in OUTCOMES]
+        for nameid, code in zip(self.nameids, self.outcomes):
+            by_code[code].add(nameid)
+        return result
 
     def find(self, testname):
-        if testname in self.testname_to_outcome:
-            print('{}:{}: {}: {}'
-                  .format(self.path,
-                          self.testname_to_lineidx[testname] + 1,
-                          self.testname_to_outcome[testname],
-                          testname))
-            return 1
-        else:
+        # Parse first: a lazy file's names aren't interned until then.
+        self.parse()
+        nameid = self.names.name_to_id.get(testname)
+        if nameid is None:
             return 0
+        # The last result for the test is the one that counts.
+        nameids = self.nameids
+        for i in range(len(nameids) - 1, -1, -1):
+            if nameids[i] == nameid:
+                self.print_match(testname, OUTCOMES[self.outcomes[i]],
+                                 self.lineidxs[i])
+                return 1
+        return 0
+
+    def print_match(self, testname, outcome, lineidx):
+        print('{}:{}: {}: {}'
+              .format(self.path, lineidx + 1, outcome, testname))
+
+
+def _testname_key(testname):
+    """
+    Stable 64-bit hash of a test name, used as the LogIndex sort key.
+    """
+    digest = hashlib.blake2b(testname.encode('utf-8', 'replace'),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class LogIndex:
+    """
+    Compact testname -> (byte offset, line index) index of a dejagnu
+    .log file.
+
+    Only a 64-bit hash of each test name is kept, in three parallel
+    arrays sorted by hash; a lookup bisects the hashes and then checks
+    the candidate lines in the memory-mapped log.  The index is saved
+    in a sidecar file next to the log (foo.log.idx) and reused for as
+    long as the log's size and mtime stay the same.
+    """
+    MAGIC = b'DJLOGIX1'
+
+    # magic, log size, log mtime (ns), number of entries
+    HEADER = struct.Struct('=8sQqQ')
+
+    def __init__(self, logpath):
+        self.logpath = logpath
+        self.idxpath = logpath + '.idx'
+
+        st = os.stat(logpath)
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+
+        self._log = None
+        self._idx = None
+        if not self._load():
+            self._build()
+            try:
+                self._save()
+            except OSError:
+                # Read-only results dir; just keep the index in memory.
+                pass
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _map_log(self):
+        if self._log is None and self.size:
+            with open(self.logpath, 'rb') as f:
+                self._log = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._log
+
+    def _load(self):
+        """
+        Map the sidecar index if it is there and still matches the log.
+        """
+        try:
+            with open(self.idxpath, 'rb') as f:
+                idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        hdr = self.HEADER
+        if len(idx) < hdr.size:
+            idx.close()
+            return False
+        magic, size, mtime_ns, count = hdr.unpack_from(idx)
+        if (magic != self.MAGIC or size != self.size
+                or mtime_ns != self.mtime_ns
+                or len(idx) != hdr.size + count * 20):
+            idx.close()
+            return False
+
+        view = memoryview(idx)
+        start = hdr.size
+        self.keys = view[start:start + count * 8].cast('Q')
+        start += count * 8
+        self.offsets = view[start:start + count * 8].cast('Q')
+        start += count * 8
+        self.lineidxs = view[start:start + count * 4].cast('I')
+        self._idx = idx
+        return True
+
+    def _build(self):
+        """
+        Scan the log once, recording where every result line starts.
+        """
+        entries = []
+        log = self._map_log()
+        if log is not None:
+            outcomes = _OUTCOME_BYTES
+            sep_end = _OUTCOME_SEP_END
+            offset = 0
+            for lineidx, line in enumerate(iter(log.readline, b'')):
+                sep = line.find(b': ', 0, sep_end)
+                if sep >= 0 and line[:sep] in outcomes:
+                    testname = line[sep + 2:].rstrip().decode('utf-8',
+                                                              'replace')
+                    entries.append((_testname_key(testname), offset, lineidx))
+                offset += len(line)
+        entries.sort()
+
+        self.keys = array('Q', (e[0] for e in entries))
+        self.offsets = array('Q', (e[1] for e in entries))
+        self.lineidxs = array('I', (e[2] for e in entries))
+
+    def _save(self):
+        with atomic_file(self.idxpath) as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.size, self.mtime_ns,
+                                     len(self.keys)))
+            self.keys.tofile(f)
+            self.offsets.tofile(f)
+            self.lineidxs.tofile(f)
+
+    def lookup(self, testname):
+        """
+        Return (outcome, lineidx) for the last result for testname in the
+        log, or None if the log has no such result.
+        """
+        key = _testname_key(testname)
+        keys = self.keys
+        i = bisect_left(keys, key)
+        found = None
+        log = self._map_log()
+        while i < len(keys) and keys[i] == key:
+            offset = self.offsets[i]
+            end = log.find(b'\n', offset)
+            if end < 0:
+                end = len(log)
+            line = log[offset:end].decode('utf-8', 'replace')
+            sep = line.find(': ')
+            if line[sep + 2:].rstrip() == testname:
+                # Entries with equal keys are sorted by offset, so the
+                # last match wins, as it does in DejaFile.
+                found = (line[:sep], self.lineidxs[i])
+            i += 1
+        return found
 
 
 class LogFile(DejaFile):
     """
     A .log file from dejagnu
+
+    With indexed=True the log is only parsed if its results are asked
+    for; find() uses a LogIndex instead, which is much cheaper for a
+    handful of lookups into a huge log.
     """
-    def __init__(self, path):
-        DejaFile.__init__(self, path)
+    def __init__(self, path, names=None, indexed=False):
+        DejaFile.__init__(self, path, names, lazy=indexed)
+        self.index = LogIndex(path) if indexed else None
+
+    def find(self, testname):
+        if self.index is None:
+            return DejaFile.find(self, testname)
+        match = self.index.lookup(testname)
+        if match is None:
+            return 0
+        outcome, lineidx = match
+        self.print_match(testname, outcome, lineidx)
+        return 1
 
     def __repr__(self):
         return 'LogFile({})'.format(self.path)
@@ -84,8 +516,8 @@ class SumFile(DejaFile):
     """
     A .sum file from dejagnu
     """
-    def __init__(self, path):
-        DejaFile.__init__(self, path)
+    def __init__(self, path, names=None, lazy=False):
+        DejaFile.__init__(self, path, names, lazy)
 
         # Locate the .log file that this is a summary of:
         root, _ = os.path.splitext(path)
@@ -94,17 +526,26 @@ class SumFile(DejaFile):
         # ...but don't parse it yet, as that's expensive:
         self.logfile = None
 
+    def parse(self):
+        if not self._parsed and results_cache is not None:
+            self.load_columns(*results_cache.get_columns(self.path))
+        DejaFile.parse(self)
+
     def load_log_file(self):
-        if not self.logfile:
-            self.logfile = LogFile(self.logpath)
+        if self.logfile is None:
+            # We only ever look up a few tests in the log, so don't
+            # parse it; use (and if needed, build) its offset index.
+            self.logfile = LogFile(self.logpath, self.names, indexed=True)
 
     def __repr__(self):
         return 'SumFile({})'.format(self.path)
 
-    def __cmp__(self, other):
-        return cmp(self.path, other.path)
+    def __lt__(self, other):
+        return self.path < other.path
 
     def relative_path(self, basedir):
+        if basedir is None:
+            return self.path
         return os.path.relpath(self.path, basedir)
 
     def find(self, testname):
@@ -118,36 +559,104 @@ class SumFile(DejaFile):
 
     def summarize(self, tr):
         tr.begin_section(self.path)
-        for outcome in OUTCOMES:
-            if self.outcome_to_testnames[outcome]:
-                tr.writeln('{}: {} tests'
-                           .format(outcome,
-                                   len(self.outcome_to_testnames[outcome])))
+        for outcome, nameids in self.nameids_by_outcome().items():
+            if nameids:
+                tr.writeln('{}: {} tests'.format(outcome, len(nameids)))
         tr.end_section()
 
 
 class TestRun:
     """
     A collection of .sum files (and their .log files); either
-    one or more individual ones, or a directory.
+    one or more individual ones, or a directory.  With path None, the
+    run starts empty; see from_sum_texts.
+
+    All of the files share one NameTable, which may also be passed in
+    to share it with other runs.
+
+    The .sum files of a directory are parsed in a pool of up to jobs
+    worker processes (by default, one per CPU); jobs=1 parses them
+    one after another in this process.  Either way the files are
+    added, and their test names interned, in find_sum_files order.
     """
-    def __init__(self, path):
+    def __init__(self, path, names=None, jobs=None):
         self.path = path
+        self.names = names if names is not None else NameTable()
         self.sumfiles = []
-        if os.path.isdir(path):
+        if path is None:
+            # The files are added with add_sum_text.
+            pass
+        elif os.path.isdir(path):
             # Locate within the directory structure:
-            def visit(_, dirname, names):
-                for name in sorted(names):
-                    if name.endswith('.sum'):
-                        sf = SumFile(os.path.join(dirname, name))
-                        self.sumfiles.append(sf)
-            os.path.walk(path, visit, None)
+            self.load_sum_files(list(find_sum_files(path)), jobs)
         else:
             # Locate individual file:
             if path.endswith('.sum'):
-                sf = SumFile(path)
+                sf = SumFile(path, self.names)
                 self.sumfiles.append(sf)
 
+    @classmethod
+    def from_sum_texts(cls, sum_texts, names=None):
+        """
+        Return a run of .sum files that we only have the text of, e.g.
+        as read from an archive.  sum_texts maps each file's path
+        relative to the run to its text.
+        """
+        run = cls(None, names)
+        for relpath, text in sum_texts.items():
+            run.add_sum_text(relpath, text)
+        return run
+
+    def load_sum_files(self, paths, jobs=None):
+        cache = results_cache
+        if cache is not None:
+            columns = [cache.load(path) for path in paths]
+            # Each worker reads a missing file once, to hash, parse
+            # and cache it.
+            parse = cache.get_columns
+        else:
+            columns = [None] * len(paths)
+            parse = parse_columns
+        missing = [i for i, c in enumerate(columns) if c is None]
+
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = min(jobs, len(missing))
+        executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        try:
+            missing_paths = [paths[i] for i in missing]
+            if executor is not None:
+                # map() hands back results in the order of paths,
+                # whatever order the workers finish in.
+                parsed = executor.map(parse, missing_paths)
+            else:
+                parsed = map(parse, missing_paths)
+            for i, c in zip(missing, parsed):
+                columns[i] = c
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for path, c in zip(paths, columns):
+            sf = SumFile(path, self.names, lazy=True)
+            sf.load_columns(*c)
+            self.sumfiles.append(sf)
+
+    def add_sum_text(self, relpath, text):
+        """
+        Add the .sum file at relpath in this run from its text, e.g. as
+        read from an archive, rather than from the file itself.
+        """
+        if results_cache is not None:
+            columns = results_cache.get_text_columns(text)
+        else:
+            columns = parse_columns_text(text)
+        if self.path is not None:
+            relpath = os.path.join(self.path, relpath)
+        sf = SumFile(relpath, self.names, lazy=True)
+        sf.load_columns(*columns)
+        self.sumfiles.append(sf)
+
     def make_dict_by_rel_path(self):
         result = {}
         for sumfile in self.sumfiles:
@@ -155,16 +664,21 @@ class TestRun:
         return result
 
     def compare(self, other):
-        pass
+        """
+        Compare this ("before") run to other ("after"), returning a
+        RunDiff.  .sum files are peer-matched by their path relative to
+        each run's path.
+        """
+        return RunDiff(self, other)
 
     def dump(self, tr):
+        names = self.names.names
         for sumfile in sorted(self.sumfiles):
             tr.begin_section(sumfile.path)
-            for outcome in OUTCOMES:
-                tr.begin_section('{}: {} tests'
-                                 .format(outcome, len(sumfile.outcome_to_testnames[outcome])))
-                for testname in sorted(sumfile.outcome_to_testnames[outcome]):
-                    tr.writeln(testname)
+            for outcome, nameids in sumfile.nameids_by_outcome().items():
+                tr.begin_section('{}: {} tests'.format(outcome, len(nameids)))
+                for testname in sorted(names[nameid] for nameid in nameids):
+                    tr.result(sumfile.path, outcome, testname)
                 tr.end_section()
             tr.end_section()
 
@@ -179,28 +693,402 @@ class TestRun:
             sumfile.summarize(tr)
 
 
+############################################################################
+# Comparing runs
+############################################################################
+
+# Outcomes that mean something is wrong.
+BAD_OUTCOMES = frozenset(['FAIL', 'XPASS', 'UNRESOLVED'])
+
+
+def final_outcomes(sumfile):
+    """
+    Return a dict from name ID to outcome code for sumfile, keeping the
+    last result for each name (as testname_to_outcome does).
+    """
+    sumfile.parse()
+    return dict(zip(sumfile.nameids, sumfile.outcomes))
+
+
+class SumFileDiff:
+    """
+    Differences between two peer .sum files.  Each list holds
+    (testname, outcome) or, for changed, (testname, before, after)
+    tuples, sorted by test name.
+    """
+    def __init__(self, relpath, before, after):
+        self.relpath = relpath
+        self.disappeared = []
+        self.appeared = []
+        self.changed = []
+
+        outcomesA = final_outcomes(before)
+        outcomesB = final_outcomes(after)
+        if before.names is after.names:
+            # Same name IDs on both sides; this is the common case, in
+            # which identical files compare equal without a merge.
+            if outcomesA == outcomesB:
+                return
+            namesA = namesB = before.names.names
+        else:
+            namesA = before.names.names
+            namesB = after.names.names
+            outcomesA = dict((namesA[i], c) for i, c in outcomesA.items())
+            outcomesB = dict((namesB[i], c) for i, c in outcomesB.items())
+            namesA = namesB = None
+
+        # One merge pass over both sides, sorted by key:
+        itemsA = sorted(outcomesA.items())
+        itemsB = sorted(outcomesB.items())
+        disappeared = self.disappeared
+        appeared = self.appeared
+        changed = self.changed
+        i = j = 0
+        lenA = len(itemsA)
+        lenB = len(itemsB)
+        while i < lenA and j < lenB:
+            keyA, codeA = itemsA[i]
+            keyB, codeB = itemsB[j]
+            if keyA == keyB:
+                if codeA != codeB:
+                    changed.append((keyA, codeA, codeB))
+                i += 1
+                j += 1
+            elif keyA < keyB:
+                disappeared.append((keyA, codeA))
+                i += 1
+            else:
+                appeared.append((keyB, codeB))
+                j += 1
+        disappeared.extend(itemsA[i:])
+        appeared.extend(itemsB[j:])
+
+        # Turn keys and codes into test names and outcomes:
+        if namesA is not None:
+            self.disappeared = sorted((namesA[k], OUTCOMES[c])
+                                      for k, c in disappeared)
+            self.appeared = sorted((namesB[k], OUTCOMES[c])
+                                   for k, c in appeared)
+            self.changed = sorted((namesA[k], OUTCOMES[a], OUTCOMES[b])
+                                  for k, a, b in changed)
+        else:
+            self.disappeared = [(k, OUTCOMES[c]) for k, c in disappeared]
+            self.appeared = [(k, OUTCOMES[c]) for k, c in appeared]
+            self.changed = [(k, OUTCOMES[a], OUTCOMES[b])
+                            for k, a, b in changed]
+
+    def __bool__(self):
+        return bool(self.disappeared or self.appeared or self.changed)
+
+    @property
+    def issue_count(self):
+        return len(self.disappeared) + len(self.appeared) + len(self.changed)
+
+    @property
+    def new_failures(self):
+        """
+        (testname, outcome) for tests that are now bad but weren't (or
+        didn't exist) before.
+        """
+        result = [(testname, after)
+                  for testname, before, after in self.changed
+                  if after in BAD_OUTCOMES and before not in BAD_OUTCOMES]
+        result += [(testname, outcome)
+                   for testname, outcome in self.appeared
+                   if outcome in BAD_OUTCOMES]
+        return sorted(result)
+
+    @property
+    def fixed(self):
+        """
+        (testname, outcome) for tests that were bad before and now
+        aren't.
+        """
+        return [(testname, after)
+                for testname, before, after in self.changed
+                if before in BAD_OUTCOMES and after not in BAD_OUTCOMES]
+
+    def report(self, tr):
+        if self.disappeared:
+            tr.begin_section('Tests that went away in {}: {}'
+                             .format(self.relpath, len(self.disappeared)))
+            for testname, outcome in self.disappeared:
+                tr.writeln('{}: {}'.format(outcome, testname))
+            tr.end_section()
+
+        if self.appeared:
+            tr.begin_section('Tests appeared in {}: {}'
+                             .format(self.relpath, len(self.appeared)))
+            for testname, outcome in self.appeared:
+                tr.writeln('{}: {}'.format(outcome, testname))
+            tr.end_section()
+
+        if self.changed:
+            tr.begin_section('Tests changing outcome in {}: {}'
+                             .format(self.relpath, len(self.changed)))
+            for testname, before, after in self.changed:
+                tr.writeln('{} -> {} : {}'.format(before, after, testname))
+            tr.end_section()
+
+
+class RunDiff:
+    """
+    Differences between a "before" and an "after" TestRun: the .sum
+    files that went away or appeared (dicts from relative path to
+    SumFile), and a SumFileDiff for every pair of peer .sum files, in
+    relative path order.
+    """
+    def __init__(self, before, after):
+        dict_by_rel_pathA = before.make_dict_by_rel_path()
+        dict_by_rel_pathB = after.make_dict_by_rel_path()
+        relpathsA = set(dict_by_rel_pathA.keys())
+        relpathsB = set(dict_by_rel_pathB.keys())
+
+        self.missing_sumfiles = dict((relpath, dict_by_rel_pathA[relpath])
+                                     for relpath in relpathsA - relpathsB)
+        self.new_sumfiles = dict((relpath, dict_by_rel_pathB[relpath])
+                                 for relpath in relpathsB - relpathsA)
+        self.files = [SumFileDiff(relpath,
+                                  dict_by_rel_pathA[relpath],
+                                  dict_by_rel_pathB[relpath])
+                      for relpath in sorted(relpathsA & relpathsB)]
+
+    @property
+    def issue_count(self):
+        return (len(self.missing_sumfiles) + len(self.new_sumfiles)
+                + sum(diff.issue_count for diff in self.files))
+
+    @property
+    def new_failures(self):
+        """
+        Dict from relative path to SumFileDiff.new_failures, for the
+        .sum files that have any.
+        """
+        result = {}
+        for diff in self.files:
+            new_failures = diff.new_failures
+            if new_failures:
+                result[diff.relpath] = new_failures
+        return result
+
+    @property
+    def fixed(self):
+        result = {}
+        for diff in self.files:
+            fixed = diff.fixed
+            if fixed:
+                result[diff.relpath] = fixed
+        return result
+
+    def report(self, tr):
+        """
+        Write the differences to a reporter.  Returns the number of
+        issues found (missing .sum files, new failures, etc).
+        """
+        if self.missing_sumfiles:
+            tr.begin_section('sum files that went away: {}'
+                             .format(len(self.missing_sumfiles)))
+            for relpath in sorted(self.missing_sumfiles):
+                self.missing_sumfiles[relpath].summarize(tr)
+            tr.end_section()
+
+        if self.new_sumfiles:
+            tr.begin_section('sum files that appeared: {}'
+                             .format(len(self.new_sumfiles)))
+            for relpath in sorted(self.new_sumfiles):
+                self.new_sumfiles[relpath].summarize(tr)
+            tr.end_section()
+
+        # Compare .sum files for which there are matching peers:
+        tr.begin_section('Comparing {} common .sum files'
+                         .format(len(self.files)))
+        for diff in self.files:
+            tr.writeln(diff.relpath)
+        tr.end_section()
+
+        for diff in self.files:
+            diff.report(tr)
+
+        issue_count = self.issue_count
+        if self.files and issue_count == 0:
+            tr.writeln('No differences found in {} common .sum files'
+                       .format(len(self.files)))
+        return issue_count
+
+
 ############################################################################
 # Various kinds of output
 ############################################################################
-class TextReporter:
-    def __init__(self):
-        self.indent = 0
+class Reporter:
+    """
+    Base class for the reporters that TestRun.dump, TestRun.summarize
+    and RunDiff.report write to.
+
+    Reporters see free text, in nested sections, and individual test
+    results.  Output goes to stream (by default sys.stdout) in batches
+    of lines rather than a write per line; it is flushed whenever the
+    outermost section ends or text is written outside any section,
+    and by flush() or close().
+    """
+    # Number of pending lines that triggers a write to the stream.
+    BUFFER_LINES = 1024
+
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.depth = 0
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, line):
+        pending = self._pending
+        pending.append(line)
+        if self.depth == 0 or len(pending) >= self.BUFFER_LINES:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.stream.write(''.join(self._pending))
+            del self._pending[:]
+        self.stream.flush()
+
+    def close(self):
+        """
+        Finish the report.  The stream itself is left open.
+        """
+        self.flush()
+
+    def begin_section(self, title):
+        self.depth += 1
+
+    def end_section(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.flush()
+
+    def writeln(self, text):
+        raise NotImplementedError
+
+    def result(self, path, outcome, testname):
+        """
+        Report one test result from the .sum file at path.
+        """
+        raise NotImplementedError
+
 
+class TextReporter(Reporter):
+    """
+    Human-readable, indented text.
+    """
     def begin_section(self, title):
         self.writeln(title)
         self.writeln('-' * len(title))
         self.writeln('')
-        self.indent += 1
+        Reporter.begin_section(self, title)
 
     def end_section(self):
         self.writeln('')
-        self.indent -= 1
+        Reporter.end_section(self)
 
     def writeln(self, text):
         if text == '':
-            print('')
+            self._write('\n')
         else:
-            print('{}{}'.format(' ' * self.indent, text))
+            self._write('{}{}\n'.format(' ' * self.depth, text))
+
+    def result(self, path, outcome, testname):
+        # Results are listed under a section for their outcome.
+        self.writeln(testname)
+
+
+class JSONLinesReporter(Reporter):
+    """
+    One JSON object per line: {"file", "outcome", "test"} for test
+    results, and {"section", "text"} for everything else.
+    """
+    def __init__(self, stream=None):
+        Reporter.__init__(self, stream)
+        self.sections = []
+        self._encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def begin_section(self, title):
+        self.sections.append(title)
+        Reporter.begin_section(self, title)
+
+    def end_section(self):
+        self.sections.pop()
+        Reporter.end_section(self)
+
+    def writeln(self, text):
+        if text:
+            self._write(self._encode({'section': self.sections,
+                                      'text': text}) + '\n')
+
+    def result(self, path, outcome, testname):
+        self._write(self._encode({'file': path,
+                                  'outcome': outcome,
+                                  'test': testname}) + '\n')
+
+
+# Characters that may not appear in an XML 1.0 document.
+_XML_INVALID_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _xml_attr(text):
+    return quoteattr(_XML_INVALID_RE.sub('?', text))
+
+
+class JUnitReporter(Reporter):
+    """
+    JUnit XML, with a <testsuite> per .sum file and a <testcase> per
+    test result.  BAD_OUTCOMES become failures, and UNSUPPORTED,
+    UNTESTED, XFAIL and KFAIL become skipped tests.  Free text is not
+    reported.
+
+    The document is written as results arrive, so the testsuites don't
+    carry test counts; close() must be called to finish it.
+    """
+    SKIPPED_OUTCOMES = frozenset(['UNSUPPORTED', 'UNTESTED', 'XFAIL', 'KFAIL'])
+
+    def __init__(self, stream=None):
+        Reporter.__init__(self, stream)
+        self._write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n')
+        self.suite = None
+        self.finished = False
+
+    def writeln(self, text):
+        pass
+
+    def result(self, path, outcome, testname):
+        if path != self.suite:
+            if self.suite is not None:
+                self._write('</testsuite>\n')
+            self._write('<testsuite name={}>\n'.format(_xml_attr(path)))
+            self.suite = path
+
+        if outcome in BAD_OUTCOMES:
+            body = '<failure type={} message={}/>'.format(
+                _xml_attr(outcome), _xml_attr(outcome))
+        elif outcome in self.SKIPPED_OUTCOMES:
+            body = '<skipped message={}/>'.format(_xml_attr(outcome))
+        else:
+            body = ''
+        # Use the .exp-relative directory of the test as its class.
+        classname = testname.split(' ', 1)[0].rpartition('/')[0]
+        self._write('<testcase classname={} name={}>{}</testcase>\n'
+                    .format(_xml_attr(classname), _xml_attr(testname), body))
+
+    def close(self):
+        if not self.finished:
+            if self.suite is not None:
+                self._write('</testsuite>\n')
+            self._write('</testsuites>\n')
+            self.finished = True
+        Reporter.close(self)
 
 ############################################################################
 # Command-line interface
@@ -0,0 +1,192 @@
+# Per-commit digests of build results.
+#
+# Every builder that tests a commit used to send its own email, plus a
+# root message per revision, so one bad commit tested on many builders
+# meant a flood of mail.  A DigestNotifier instead collects the result
+# of each builder for a revision, from the first one to arrive until
+# window seconds later (or until every expected builder has reported),
+# and then sends a single message for the commit, rendered from a
+# Jinja2 template that is compiled once.
+#
+# With a statepath, the results still waiting to be sent are saved
+# there (as JSON) whenever they change, and picked up again by the next
+# DigestNotifier, so that a restart or a reconfig doesn't lose them.
+# Each message gets its own Message-Id, and any later digest for the
+# same revision (e.g. after a rebuild) is sent as a reply to the first.
+
+import json
+from collections import OrderedDict
+from email.mime.text import MIMEText
+
+from jinja2 import Environment, StrictUndefined
+
+from atomicfile import write_atomically
+
+# Results that don't count as the builder failing the commit.
+GOOD_RESULTS = ('success', 'warnings', 'skipped')
+
+DIGEST_TEMPLATE = """\
+*** TEST RESULTS FOR COMMIT {{ revision }} ***
+
+Author: {{ author }}
+Branch: {{ branch }}
+Commit: {{ revision }}
+
+{{ comments }}
+
+{% if failed %}
+{{ failed|length }} of {{ builds|length }} builder(s) failed: {{ failed|join(', ') }}
+{% else %}
+All {{ builds|length }} builder(s) passed.
+{% endif %}
+{% for build in builds %}
+
+======================================================================
+{{ build.builder }}: {{ build.result }}
+{% if build.subject %}
+{{ build.subject }}
+{% endif %}
+======================================================================
+{{ build.body }}
+{% endfor %}
+"""
+
+
+class DigestNotifier:
+    """
+    Gathers the results for each revision and sends one message per
+    revision through send(sender, recipients, message_text).
+    """
+    # Revisions whose thread (number of digests sent, first Message-Id)
+    # is remembered.
+    MAX_THREADS = 1000
+
+    def __init__(self, send, sender, recipients, window=600,
+                 expected_builders=None, clock=None, template=None,
+                 statepath=None):
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.send = send
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.window = window
+        self.expected_builders = set(expected_builders or [])
+        self.clock = clock
+        env = Environment(undefined=StrictUndefined, trim_blocks=True,
+                          keep_trailing_newline=True)
+        self.template = env.from_string(template or DIGEST_TEMPLATE)
+        self.statepath = statepath
+        # revision -> {'info': ..., 'builds': {builder: ...},
+        #              'deadline': ..., 'timer': ...}
+        self.pending = {}
+        # revision -> [digests sent, Message-Id of the first], oldest
+        # first.
+        self.threads = OrderedDict()
+        self._load()
+
+    def _load(self):
+        if self.statepath is None:
+            return
+        try:
+            with open(self.statepath) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        for revision, count, root in state['threads']:
+            self.threads[revision] = [count, root]
+        now = self.clock.seconds()
+        for revision, entry in state['pending'].items():
+            # The window carries on from where it was.
+            entry['timer'] = self.clock.callLater(
+                max(0, entry['deadline'] - now), self.flush, revision)
+            self.pending[revision] = entry
+
+    def _save(self):
+        if self.statepath is None:
+            return
+        pending = {revision: {key: value for key, value in entry.items()
+                              if key != 'timer'}
+                   for revision, entry in self.pending.items()}
+        threads = [[revision, count, root]
+                   for revision, (count, root) in self.threads.items()]
+        write_atomically(self.statepath,
+                         json.dumps({'pending': pending, 'threads': threads}),
+                         fsync=True)
+
+    def add(self, revision, branch, author, comments, builder, result,
+            subject='', body=''):
+        """
+        Add the result (a string such as 'success' or 'failure') of
+        builder for revision.  The first result for a revision starts
+        its window.
+        """
+        entry = self.pending.get(revision)
+        if entry is None:
+            entry = {'info': {'revision': revision,
+                              'branch': branch,
+                              'author': author,
+                              'comments': comments},
+                     'builds': {},
+                     'deadline': self.clock.seconds() + self.window,
+                     'timer': self.clock.callLater(self.window, self.flush,
+                                                   revision)}
+            self.pending[revision] = entry
+        # A rebuild replaces the builder's earlier result.
+        entry['builds'][builder] = {'builder': builder,
+                                    'result': result,
+                                    'subject': subject,
+                                    'body': body}
+        if self.expected_builders \
+           and self.expected_builders <= set(entry['builds']):
+            self.flush(revision)
+        else:
+            self._save()
+
+    def render(self, info, builds):
+        builds = sorted(builds, key=lambda b: b['builder'])
+        failed = [b['builder'] for b in builds
+                  if b['result'] not in GOOD_RESULTS]
+        return self.template.render(builds=builds, failed=failed, **info)
+
+    def flush(self, revision):
+        """
+        Send the digest for revision now.
+        """
+        entry = self.pending.pop(revision, None)
+        if entry is None:
+            return
+        if entry['timer'].active():
+            entry['timer'].cancel()
+        info = entry['info']
+        builds = list(entry['builds'].values())
+        title = info['comments'].split('\n')[0]
+
+        mail = MIMEText(self.render(info, builds))
+        failed = sum(1 for b in builds if b['result'] not in GOOD_RESULTS)
+        if info['branch'] in (None, 'trunk', 'master'):
+            subject = '[gcc] {}'.format(title)
+        else:
+            subject = '[gcc/{}] {}'.format(info['branch'], title)
+        if failed:
+            subject += ' ({} of {} builders failed)'.format(failed, len(builds))
+        mail['Subject'] = subject
+        mail['From'] = self.sender
+        mail['To'] = ', '.join(self.recipients)
+        count, root = self.threads.pop(revision, (0, None))
+        count += 1
+        msgid = '<{}.{}@gcc-build>'.format(revision, count)
+        if root is None:
+            root = msgid
+        else:
+            mail['In-Reply-To'] = root
+            mail['References'] = root
+        mail['Message-Id'] = msgid
+        self.threads[revision] = [count, root]
+        while len(self.threads) > self.MAX_THREADS:
+            self.threads.popitem(last=False)
+        self.send(self.sender, self.recipients, mail.as_string())
+        self._save()
+
+    def flush_all(self):
+        for revision in list(self.pending):
+            self.flush(revision)
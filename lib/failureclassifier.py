@@ -0,0 +1,141 @@
+# Classification of build failures from their logs.
+#
+# Rather than a chain of checks, each searching a whole log for one
+# string, the classifier knows a catalogue of failure signatures (each
+# a name, a regular expression and a description) and compiles them
+# into a single alternation, so that every line of a log is scanned
+# once however many signatures there are.  The default catalogue covers
+# the usual ways a toolchain build dies; load_signatures() reads
+# another one from a JSON file, a list of objects with "name",
+# "pattern" and "description".
+#
+# FailureObserver does the classification while a step runs, and the
+# step publishes the result as the 'failure_classification' build
+# property (name -> description, count, first matching line and the
+# steps it was found in) if it fails.  The names of all the failed steps
+# that were classified, whether anything was found or not, go in the
+# 'failure_classified_steps' property; the logs of other steps haven't
+# been looked at.
+
+import json
+import re
+from collections import namedtuple
+
+from buildbot.process.logobserver import LogLineObserver
+
+Signature = namedtuple('Signature', ['name', 'pattern', 'description'])
+
+DEFAULT_SIGNATURES = [
+    Signature('enospc',
+              r'No space left on device|\bENOSPC\b',
+              'out of disk space on the worker'),
+    Signature('oom-cc1',
+              r'Killed signal terminated program (?:cc1\w*|lto1)'
+              r'|virtual memory exhausted'
+              r'|out of memory allocating \d+ bytes',
+              'compiler killed or out of memory'),
+    Signature('qemu-crash',
+              r'qemu[\w-]*: (?:uncaught target signal \d+|fatal:)'
+              r'|QEMU internal SIG\w+',
+              'QEMU crashed'),
+    Signature('git-fetch-timeout',
+              r"fatal: unable to access '[^']*': .*(?:timed out|Timeout)"
+              r'|fatal: the remote end hung up unexpectedly'
+              r'|RPC failed; .*(?:timed out|curl 28)',
+              'git fetch timed out or was cut off'),
+    Signature('ice',
+              r'internal compiler error',
+              'internal compiler error'),
+    Signature('linker-error',
+              r'undefined reference to `'
+              r'|\bld(?:\.bfd|\.gold)?: cannot find -l'
+              r'|collect2: error: ld returned \d+ exit status'
+              r'|relocation truncated to fit',
+              'link failed'),
+]
+
+# Longest matching line kept as an example.
+MAX_EXAMPLE = 300
+
+
+def load_signatures(path):
+    """
+    Return the list of Signatures in the JSON file at path.
+    """
+    with open(path) as f:
+        return [Signature(s['name'], s['pattern'],
+                          s.get('description', s['name']))
+                for s in json.load(f)]
+
+
+class FailureClassifier:
+    """
+    Scan lines for any of signatures (by default DEFAULT_SIGNATURES),
+    counting the matches of each.
+    """
+    def __init__(self, signatures=None):
+        if signatures is None:
+            signatures = DEFAULT_SIGNATURES
+        self.signatures = list(signatures)
+        # Group g<i> of the combined pattern is signatures[i].
+        self.regex = re.compile('|'.join(
+            '(?P<g{}>{})'.format(i, s.pattern)
+            for i, s in enumerate(self.signatures)))
+        self.matches = {}
+
+    def feed_line(self, line):
+        for m in self.regex.finditer(line):
+            signature = self.signatures[int(m.lastgroup[1:])]
+            match = self.matches.get(signature.name)
+            if match is None:
+                self.matches[signature.name] = {
+                    'description': signature.description,
+                    'count': 1,
+                    'example': line.strip()[:MAX_EXAMPLE]}
+            else:
+                match['count'] += 1
+
+    def feed(self, lines):
+        for line in lines:
+            self.feed_line(line)
+        return self.matches
+
+
+class FailureObserver(LogLineObserver):
+    """
+    Classify the lines of a step's log as they arrive.  Call publish()
+    once the step is known to have failed.
+    """
+    def __init__(self, signatures=None):
+        LogLineObserver.__init__(self)
+        self.classifier = FailureClassifier(signatures)
+
+    def outLineReceived(self, line):
+        self.classifier.feed_line(line)
+
+    errLineReceived = outLineReceived
+
+    def publish(self):
+        step = self.step.name
+        classified = list(
+            self.step.getProperty('failure_classified_steps') or [])
+        if step not in classified:
+            classified.append(step)
+        self.step.setProperty('failure_classified_steps', classified,
+                              'FailureObserver')
+        if not self.classifier.matches:
+            return
+        # Several steps may have failed; keep what earlier ones found.
+        classification = dict(
+            self.step.getProperty('failure_classification') or {})
+        for name, match in self.classifier.matches.items():
+            if name in classification:
+                earlier = dict(classification[name])
+                earlier['count'] += match['count']
+                if step not in earlier['steps']:
+                    earlier['steps'] = earlier['steps'] + [step]
+                classification[name] = earlier
+            else:
+                classification[name] = dict(match, steps=[step])
+        self.step.setProperty('failure_classification', classification,
+                              'FailureObserver')
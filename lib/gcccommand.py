@@ -1,13 +1,142 @@
 # GCC .sum-fetching command.
 
+import os
+import shlex
+import tarfile
+import threading
+from collections import OrderedDict
+from twisted.internet import defer, reactor, threads
+from twisted.python import log
+from twisted.python.threadpool import ThreadPool
 from buildbot.status.builder import SUCCESS, WARNINGS, FAILURE, EXCEPTION
+from buildbot.process.logobserver import LogLineObserver
+from buildbot.process.properties import renderer
 from buildbot.steps.shell import ShellCommand
+from buildbot.steps.transfer import FileUpload
+from dejagnu import (BAD_OUTCOMES, OUTCOMES, ResultStream, TestRun,
+                     set_results_cache)
 from sumfiles import DejaResults, get_web_base
-from gccgitdb import switch_to_branch
-from shutil import copyfile
+from resultstore import (ResultsStore, SUM, PREVIOUS_SUM, BASELINE,
+                         TRY_SUM)
+from baselinecache import BaselineCache
+from resultcache import ResultsCache
+from testhistory import HistoryStore
+from resultsgit import GitResultsWriter, ResultsBatch
+from regressionreport import RegressionReport
+from urllib.parse import quote
+
+# Parsed baselines, previous sums and xfail lists, shared by every
+# build that this master runs.
+baseline_cache = BaselineCache ()
+
+# The files that each kind of cached result is read from; a cached
+# result is reloaded when any of them changes.  The previous sum and
+# the baseline come from the results store, whose refs are replaced
+# whenever they change.
+def _cached_result_paths (builder, branch, kind):
+    wb = get_web_base ()
+    store = get_results_store ()
+    if kind == 'sum':
+        return [ store.ref_path (builder, branch, PREVIOUS_SUM) ]
+    elif kind == 'baseline':
+        return [ store.ref_path (builder, branch, BASELINE),
+                 os.path.join (wb, builder, 'xfails', branch, 'xfail') ]
+    else:
+        return [ os.path.join (wb, builder, 'xfails', branch, 'xfail'),
+                 os.path.join (wb, builder, 'xfails', branch, '.last-commit') ]
+
+def read_cached (builder, branch, kind, load):
+    """Return the parsed KIND ('sum', 'baseline' or 'xfail') results of
+BUILDER on BRANCH from baseline_cache, calling LOAD () to parse them if
+they aren't cached or their files have changed."""
+    return baseline_cache.get ((builder, branch, kind),
+                               _cached_result_paths (builder, branch, kind),
+                               load)
+
+class CachedDejaResults (DejaResults):
+    """DejaResults whose xfail lists, which compute_regressions reads
+through read_xfail, come from baseline_cache."""
+    def read_xfail (self, builder, branch):
+        return read_cached (builder, branch, 'xfail',
+                            lambda: DejaResults.read_xfail (self, builder,
+                                                            branch))
+
+def get_results_store ():
+    """Return the store of gcc.sum, previous_gcc.sum, baseline and
+try-build results shared by all builders."""
+    return ResultsStore (os.path.join (get_web_base (), 'results-store'))
+
+_results_cache = None
+
+def get_results_cache ():
+    """Return the on-disk cache of parsed .sum files under the web base,
+installing it for dejagnu's SumFile and TestRun the first time."""
+    global _results_cache
+    if _results_cache is None:
+        _results_cache = ResultsCache (os.path.join (get_web_base (),
+                                                     'results-cache'))
+        set_results_cache (_results_cache)
+    return _results_cache
+
+def seed_results_store (store, builder, branch, name, path):
+    """If STORE has no NAME results for BUILDER on BRANCH yet, take them
+from the file at PATH, where they were kept before there was a store.
+Returns whether STORE has NAME results now."""
+    if store.get_ref (builder, branch, name) is not None:
+        return True
+    try:
+        with open (path) as f:
+            store.write (builder, branch, name, f.read ())
+    except IOError:
+        # If the file does not exist, ignore
+        return False
+    return True
+
+def read_stored (parser, builder, branch, name, kind):
+    """Return the NAME results of BUILDER on BRANCH from the results
+store, parsed by PARSER and cached as KIND (see read_cached), or None
+if there are none."""
+    store = get_results_store ()
+    def load ():
+        text = store.read (builder, branch, name)
+        return parser.read_sum_text (text) if text is not None else None
+    return read_cached (builder, branch, kind, load)
+
+def read_xfail_commit (xfaildir):
+    """Return the gcc-xfails.git commit that the xfail list in XFAILDIR
+comes from, as recorded in its .last-commit, or None if unknown."""
+    try:
+        with open (os.path.join (xfaildir, '.last-commit')) as f:
+            return f.read ().strip ('\n') or None
+    except IOError:
+        return None
+
+def get_results_repo ():
+    """Return a writer for the bare git repository that collects every
+builder's results, one branch per builder and branch (see
+results_branch)."""
+    return GitResultsWriter.init_bare (os.path.join (get_web_base (),
+                                                     'results.git'))
+
+def results_branch (builder, branch):
+    # Quote BRANCH, so that e.g. 'foo' and 'foo/bar' don't clash.
+    return '%s/%s' % (builder, quote (branch, safe = ''))
+
+_history_stores = {}
+
+def get_history_store (builder, branch):
+    """Return the HistoryStore of the test outcomes of every build of
+BUILDER on BRANCH."""
+    key = (builder, branch)
+    if key not in _history_stores:
+        _history_stores[key] = HistoryStore (
+            os.path.join (get_web_base (), builder, 'history',
+                          quote (branch, safe = '')))
+    return _history_stores[key]
 
 class CopyOldGCCSumFile (ShellCommand):
-    """Copy the current gcc.sum file into the old_gcc.sum file."""
+    """Make the current gcc.sum file the previous_gcc.sum file.  This
+only updates a ref in the results store; nothing is copied."""
     name = "copy gcc.sum file"
     description = "copying previous gcc.sum file"
     descriptionDone = "copied previous gcc.sum file"
@@ -28,24 +157,86 @@ class CopyOldGCCSumFile (ShellCommand):
         if isrebuild and isrebuild == 'yes':
             return SUCCESS
 
-        # Switch to the right branch inside the BUILDER repo
-        switch_to_branch (builder, branch, force_switch = True)
-
-        try:
-            copyfile ("%s/%s/gcc.sum" % (wb, builder),
-                      "%s/%s/previous_gcc.sum" % (wb, builder))
-        except IOError:
-            # If the dest file does not exist, ignore
-            pass
+        store = get_results_store ()
+        if not store.promote (builder, branch, SUM, PREVIOUS_SUM):
+            # The store doesn't know this builder/branch yet, so seed it
+            # from the web base copy.
+            seed_results_store (store, builder, branch, PREVIOUS_SUM,
+                                "%s/%s/gcc.sum" % (wb, builder))
 
         return SUCCESS
 
+# Regression evaluation (parsing, comparing and writing results) runs
+# in this many threads rather than in the reactor, which would stall
+# the web UI, the workers' connections and all other builds meanwhile.
+# When more builds than that finish at once, the rest wait their turn.
+EVALUATION_THREADS = 2
+
+_evaluation_pool = None
+_evaluation_slots = defer.DeferredSemaphore (EVALUATION_THREADS)
+
+def run_evaluation (f, *args, **kwargs):
+    """Run F (*ARGS, **KWARGS) in the regression evaluation thread pool,
+returning a Deferred that fires with its result."""
+    global _evaluation_pool
+    if _evaluation_pool is None:
+        _evaluation_pool = ThreadPool (minthreads = 0,
+                                       maxthreads = EVALUATION_THREADS,
+                                       name = 'gcc-evaluation')
+        _evaluation_pool.start ()
+        reactor.addSystemEventTrigger ('during', 'shutdown',
+                                       _evaluation_pool.stop)
+    return _evaluation_slots.run (threads.deferToThreadPool, reactor,
+                                  _evaluation_pool, f, *args, **kwargs)
+
+_evaluation_locks = {}
+_evaluation_locks_lock = threading.Lock ()
+
+def evaluation_lock (builder, branch):
+    """Return the lock held while evaluating a build of BUILDER on
+BRANCH, so that two evaluations can't update its results at once."""
+    with _evaluation_locks_lock:
+        return _evaluation_locks.setdefault ((builder, branch),
+                                             threading.Lock ())
+
+def report_logs (name, report, sum_text):
+    """Return the [ (log name, text) ] to attach for REPORT.  Short
+reports are attached as they are; a long one becomes a bounded summary
+grouped by .exp file in log NAME, with the whole report in NAME-full."""
+    summary = RegressionReport (report, sum_text)
+    if not summary.is_truncated ():
+        return [ (name, report) ]
+    return [ (name, summary.summary ()), (name + '-full', report) ]
+
 class GccCatSumfileCommand(ShellCommand):
     name = 'regressions'
     command = ['cat', 'gcc.sum']
 
     def __init__(self, **kwargs):
         ShellCommand.__init__(self, **kwargs)
+        self.stdio_text = None
+
+    def commandComplete (self, cmd):
+        # Logs can only be read from the reactor thread.
+        self.stdio_text = self.getLog('stdio').getText()
+
+    def getSumText (self, builder):
+        """Return the text of the gcc.sum file to evaluate.  This is
+called from the evaluation thread pool, so it must not touch the step's
+properties; BUILDER is the builder's name."""
+        return self.stdio_text
+
+    def collectResultFiles (self, batch, builder):
+        """Add any other files this build of BUILDER produced to BATCH,
+the ResultsBatch of its results.  This is called from the evaluation
+thread pool."""
+        pass
+
+    def getTestRun (self, builder, sum_text):
+        """Return the dejagnu.TestRun of this build's results, to record
+in its history.  This is called from the evaluation thread pool."""
+        get_results_cache ()
+        return TestRun.from_sum_texts ({ 'gcc.sum' : sum_text })
 
     def evaluateCommand(self, cmd):
         rev = self.getProperty('got_revision')
@@ -55,37 +246,363 @@ class GccCatSumfileCommand(ShellCommand):
         if branch is None:
             branch = 'master'
 
-        # Switch to the right branch inside the BUILDER repo
-        switch_to_branch (builder, branch, force_switch = False)
+        d = run_evaluation (self.evaluateResults,
+                            rev, builder, istrysched, branch)
+        d.addCallback (self.publishResults)
+        return d
 
-        parser = DejaResults()
-        cur_results = parser.read_sum_text(self.getLog('stdio').getText())
-        baseline = parser.read_baseline (builder, branch)
-        old_sum = parser.read_sum_file (builder, branch)
+    def evaluateResults (self, rev, builder, istrysched, branch):
+        """Compare this build's results to the baseline and the previous
+build, and record them.  This runs in the evaluation thread pool, so
+instead of touching the step it returns (result, [ (log name, text) ],
+{ property name : value })."""
+        with evaluation_lock (builder, branch):
+            return self.evaluateLocked (rev, builder, istrysched, branch)
+
+    def evaluateLocked (self, rev, builder, istrysched, branch):
+        logs = []
+
+        parser = CachedDejaResults()
+        sum_text = self.getSumText (builder)
+        cur_results = parser.read_sum_text(sum_text)
+        store = get_results_store ()
+        seed_results_store (store, builder, branch, BASELINE,
+                            os.path.join (get_web_base (), builder, 'baseline'))
+        baseline = read_stored (parser, builder, branch, BASELINE, 'baseline')
+        old_sum = read_stored (parser, builder, branch, PREVIOUS_SUM, 'sum')
         result = SUCCESS
 
         if baseline is not None:
             report = parser.compute_regressions (builder, branch,
                                                  cur_results, baseline)
-            if report is not '':
-                self.addCompleteLog ('baseline_diff', report)
+            if report != '':
+                logs += report_logs ('baseline_diff', report, sum_text)
                 result = WARNINGS
 
         if old_sum is not None:
             report = parser.compute_regressions (builder, branch,
                                                  cur_results, old_sum)
-            if report is not '':
-                self.addCompleteLog ('regressions', report)
+            if report != '':
+                logs += report_logs ('regressions', report, sum_text)
                 result = FAILURE
 
+        # The store's refs all change in one update_refs, and
+        # everything this build publishes goes into the results
+        # repository as one commit, so that a crash can't leave either
+        # half-updated.  The store is updated first, being what the
+        # next build reads.
+        batch = ResultsBatch (get_results_repo (),
+                              results_branch (builder, branch),
+                              'Results for %s on %s' % (rev, builder))
+        digest = store.put (sum_text.encode ('utf-8'))
         if not istrysched or istrysched == 'no':
-            parser.write_sum_file (cur_results, builder, branch)
+            refs = { SUM : digest }
+            batch.promote (SUM, PREVIOUS_SUM)
+            batch.add (SUM, sum_text)
             # If there was no previous baseline, then this run
             # gets the honor.
             if baseline is None:
-                baseline = cur_results
-            parser.write_baseline (baseline, builder, branch, rev)
+                refs[BASELINE] = digest
+                batch.promote (SUM, BASELINE)
         else:
-            parser.write_try_build_sum_file (cur_results, builder, branch)
+            refs = { TRY_SUM : digest }
+            batch.add (TRY_SUM, sum_text)
+        store.update_refs (builder, branch, refs)
+
+        # Don't leave the previous build's reports behind.
+        for name in [ 'baseline_diff', 'regressions' ]:
+            batch.delete ('reports/%s' % name)
+            batch.delete ('reports/%s-full' % name)
+        for name, text in logs:
+            batch.add ('reports/%s' % name, text)
+        xfaildir = os.path.join (get_web_base (), builder, 'xfails', branch)
+        for name in [ 'xfail', '.last-commit' ]:
+            if os.path.exists (os.path.join (xfaildir, name)):
+                batch.add_file ('xfails/%s' % name,
+                                os.path.join (xfaildir, name))
+        self.collectResultFiles (batch, builder)
+        # Where the notifications point to for this build's results,
+        # and for the xfail list they were compared with.
+        properties = { 'results_branch' : results_branch (builder, branch),
+                       'results_commit' : batch.commit (),
+                       'xfail_commit' : read_xfail_commit (xfaildir) }
+
+        if rev is not None and (not istrysched or istrysched == 'no'):
+            get_history_store (builder, branch).record (
+                rev, self.getTestRun (builder, sum_text))
+
+        return result, logs, properties
 
+    def publishResults (self, evaluation):
+        """Back in the reactor thread, attach what evaluateResults found
+to the step."""
+        result, logs, properties = evaluation
+        for name, text in logs:
+            self.addCompleteLog (name, text)
+        for name, value in properties.items ():
+            self.setProperty (name, value, 'GccCatSumfileCommand')
+        self.setProperty ('baseline_cache', baseline_cache.stats (),
+                          'GccCatSumfileCommand')
         return result
+
+# Name of the archive of .sum and .log files that PackTestResults
+# creates on the worker and UploadTestResults sends to the master.
+TEST_RESULTS_ARCHIVE = 'testresults.tar.xz'
+
+# Where the gcc.sum to evaluate is, relative to the directory that
+# PackTestResults packs (the riscv-gnu-toolchain build tree).
+MAIN_SUM_FILE = 'build-gcc-newlib-stage2/gcc/testsuite/gcc/gcc.sum'
+
+def results_archive_path (builder, branch, buildnumber):
+    """Where the master keeps the test results archive of build
+BUILDNUMBER of BUILDER on BRANCH until it has been evaluated.  Builds
+of other branches may be uploading theirs at the same time."""
+    return os.path.join (get_web_base (), builder, 'testresults',
+                         quote (branch, safe = ''),
+                         '%s.tar.xz' % buildnumber)
+
+def latest_results_archive_path (builder, branch, trybuild = False):
+    """Where the master keeps the test results archive of the last
+evaluated build (or try build, if TRYBUILD) of BUILDER on BRANCH."""
+    name = TEST_RESULTS_ARCHIVE
+    if trybuild:
+        name = 'try-' + name
+    return os.path.join (get_web_base (), builder, 'testresults',
+                         quote (branch, safe = ''), name)
+
+def build_results_archive_path (props):
+    """results_archive_path of the build whose properties are PROPS."""
+    branch = props.getProperty ('branch')
+    if branch is None:
+        branch = 'master'
+    return results_archive_path (props.getProperty ('buildername'), branch,
+                                 props.getProperty ('buildnumber'))
+
+@renderer
+def _results_archive_dest (props):
+    return build_results_archive_path (props)
+
+class PackTestResults (ShellCommand):
+    """Pack every .sum file in the build tree, and the .log file next to
+it, into one xz-compressed tarball on the worker.  SUMFILE goes first
+and all the .sum files go before any .log file, so that the master can
+read them without decompressing the logs (see read_archived_sums)."""
+    name = 'pack test results'
+    description = 'packing test results'
+    descriptionDone = 'packed test results'
+
+    def __init__ (self, sumfile = MAIN_SUM_FILE, **kwargs):
+        ShellCommand.__init__ (self, **kwargs)
+        main = shlex.quote ('./' + sumfile)
+        self.command = [ 'sh', '-c',
+                         "sums=$({ test -f %s && echo %s; "
+                         "find . -name '*.sum' ! -path %s -print; }); "
+                         "{ echo \"$sums\"; "
+                         "echo \"$sums\" | sed 's/\\.sum$/.log/'; } "
+                         "| XZ_OPT=-T0 tar --ignore-failed-read -cJf %s -T -"
+                         % (main, main, main, TEST_RESULTS_ARCHIVE) ]
+        self.haltOnFailure = True
+
+class UploadTestResults (FileUpload):
+    """Upload the archive made by PackTestResults to the master (see
+results_archive_path), instead of sending gcc.sum through stdio."""
+    name = 'upload test results'
+
+    def __init__ (self, **kwargs):
+        FileUpload.__init__ (self,
+                             workersrc = TEST_RESULTS_ARCHIVE,
+                             masterdest = _results_archive_dest,
+                             **kwargs)
+        self.haltOnFailure = True
+
+def read_archived_sums (archive):
+    """Return an OrderedDict from the path of each .sum file in the
+tarball ARCHIVE, relative to the packed directory, to its text.  As
+PackTestResults puts the .sum files first, reading stops at the first
+other file, and the .log files are never decompressed."""
+    sums = OrderedDict ()
+    with tarfile.open (archive, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile ():
+                continue
+            if not member.name.endswith ('.sum'):
+                break
+            with tar.extractfile (member) as f:
+                sums[os.path.normpath (member.name)] = \
+                    f.read ().decode ('utf-8', 'replace')
+    return sums
+
+class GccArchivedSumfileCommand (GccCatSumfileCommand):
+    """Like GccCatSumfileCommand, but read gcc.sum straight from the
+archive uploaded by UploadTestResults, so that it never goes through
+the step's stdio log (and the log database)."""
+    command = [ 'true' ]
+
+    def __init__ (self, sumfile = MAIN_SUM_FILE, **kwargs):
+        GccCatSumfileCommand.__init__ (self, **kwargs)
+        self.sumfile = os.path.normpath (sumfile)
+        self.archive = None
+        self.sum_texts = None
+
+    def commandComplete (self, cmd):
+        pass
+
+    def evaluateCommand (self, cmd):
+        # Properties can only be read from the reactor thread.
+        self.archive = build_results_archive_path (self)
+        return GccCatSumfileCommand.evaluateCommand (self, cmd)
+
+    def getSumTexts (self):
+        """Return read_archived_sums of this build's archive, which is
+only read once however many times it's asked for."""
+        if self.sum_texts is None:
+            self.sum_texts = read_archived_sums (self.archive)
+        return self.sum_texts
+
+    def getSumText (self, builder):
+        return self.getSumTexts ().get (self.sumfile, '')
+
+    def collectResultFiles (self, batch, builder):
+        # Publish every .sum in the archive.  The .log files, which
+        # can be huge, stay in the archive.
+        for name, text in self.getSumTexts ().items ():
+            batch.add ('testresults/%s' % name, text)
+
+    def getTestRun (self, builder, sum_text):
+        # Record every .sum file in the archive, not just gcc.sum.
+        get_results_cache ()
+        return TestRun.from_sum_texts (self.getSumTexts ())
+
+    def evaluateLocked (self, rev, builder, istrysched, branch):
+        evaluation = GccCatSumfileCommand.evaluateLocked (self, rev, builder,
+                                                          istrysched, branch)
+        # Keep only the last evaluated archive of each branch, with the
+        # .log files that its results refer to.
+        trybuild = bool (istrysched) and istrysched != 'no'
+        os.replace (self.archive,
+                    latest_results_archive_path (builder, branch, trybuild))
+        self.sum_texts = None
+        return evaluation
+
+def load_previous_results (builder, branch):
+    """Return a dict from test name to outcome of the last gcc.sum of
+BUILDER on BRANCH in the results store, or None if there is none.  This
+is meant to run in the evaluation thread pool."""
+    text = get_results_store ().read (builder, branch, SUM)
+    if text is None:
+        return None
+    testnames, outcomes, _ = get_results_cache ().get_text_columns (text)
+    return dict (zip (testnames, (OUTCOMES[code] for code in outcomes)))
+
+class DejaGnuResultsObserver (LogLineObserver):
+    """Parse dejagnu results out of a step's stdio while the step is
+still running.  Running counts per outcome of the results printed go in
+the 'testsuite_counts' build property, and tests that go bad compared
+to the previous results (a dict from test name to outcome, given to
+set_previous) are collected in 'regressions' and counted in the
+'testsuite_regressions' property.  Bad results that arrive before the
+previous results are known are held until they are."""
+
+    # Number of results between updates of the build properties.
+    update_every = 1000
+
+    def __init__ (self):
+        LogLineObserver.__init__ (self)
+        self.stream = ResultStream ()
+        self.previous = None
+        self.waiting = []
+        self.regressions = []
+        self.pending = 0
+
+    def set_previous (self, previous):
+        """Compare against PREVIOUS from now on (None if there are no
+previous results), including the bad results seen so far."""
+        self.previous = previous
+        waiting, self.waiting = self.waiting, None
+        if previous is not None:
+            for testname, outcome in waiting:
+                self.check (testname, outcome)
+        self.publish ()
+
+    def check (self, testname, outcome):
+        before = self.previous.get (testname)
+        if before not in BAD_OUTCOMES:
+            self.regressions.append ((testname, before, outcome))
+
+    def outLineReceived (self, line):
+        for outcome, testname, lineno in self.stream.feed_line (line):
+            if outcome in BAD_OUTCOMES:
+                if self.waiting is not None:
+                    self.waiting.append ((testname, outcome))
+                elif self.previous is not None:
+                    self.check (testname, outcome)
+            self.pending += 1
+
+        if self.pending >= self.update_every:
+            self.publish ()
+
+    def finishReceived (self):
+        self.publish ()
+
+    def publish (self):
+        self.pending = 0
+        self.step.setProperty ('testsuite_counts',
+                               dict (self.stream.counts),
+                               'DejaGnuResultsObserver')
+        self.step.setProperty ('testsuite_regressions',
+                               len (self.regressions),
+                               'DejaGnuResultsObserver')
+
+class GccLiveTestsuiteCommand (ShellCommand):
+    """Run the testsuite, parsing the results it prints (those that
+aren't PASSes) as they arrive, so that progress and early regressions
+show up while it runs.  The complete results are still evaluated
+afterwards from the uploaded .sum files (see GccArchivedSumfileCommand);
+this step only gives an early warning."""
+    name = 'testsuite'
+    description = 'running testsuite'
+    descriptionDone = 'ran testsuite'
+    command = [ 'make', '-k', 'check-gcc-newlib' ]
+
+    def __init__ (self, **kwargs):
+        ShellCommand.__init__ (self, **kwargs)
+        self.flunkOnFailure = False
+        self.warnOnFailure = True
+        self.results_observer = DejaGnuResultsObserver ()
+        self.addLogObserver ('stdio', self.results_observer)
+        self.previous_loaded = None
+
+    def start (self):
+        # Compare against the results of the previous build, if any,
+        # loaded in the evaluation pool rather than in the reactor.
+        builder = self.getProperty ('buildername')
+        branch = self.getProperty ('branch')
+        if branch is None:
+            branch = 'master'
+        d = run_evaluation (load_previous_results, builder, branch)
+        d.addCallback (self.results_observer.set_previous)
+        d.addErrback (self.previousFailed)
+        self.previous_loaded = d
+
+        return ShellCommand.start (self)
+
+    def previousFailed (self, failure):
+        log.err (failure, 'loading the previous results of %s'
+                 % self.getProperty ('buildername'))
+        self.results_observer.set_previous (None)
+
+    def evaluateCommand (self, cmd):
+        # The previous results have normally been loaded long before
+        # the testsuite finishes, but wait for them if not.
+        d = self.previous_loaded
+        d.addCallback (lambda _: self.reportRegressions (cmd))
+        return d
+
+    def reportRegressions (self, cmd):
+        regressions = self.results_observer.regressions
+        if regressions:
+            report = ''.join ('%s -> %s : %s\n' % (before or 'NEW', after, testname)
+                              for testname, before, after in regressions)
+            self.addCompleteLog ('early regressions', report)
+
+        return ShellCommand.evaluateCommand (self, cmd)
@@ -0,0 +1,88 @@
+# Bounded access to step logs for the notifiers.
+#
+# A failed toolchain build can leave a compile log of hundreds of MB,
+# and the failure emails only need its last lines and whether it
+# mentions a few strings.  Fetching it with getText() means holding all
+# of it in memory (twice, once decoded).  These functions instead go
+# through the log's stored chunks one at a time, with getChunks() where
+# the log has it, keeping only what the caller asked for: the memory
+# used is proportional to the excerpt, not to the log.
+
+from collections import deque
+
+# Size of the pieces text is processed in, when a log can only give us
+# all of it at once.
+CHUNK_SIZE = 1 << 16
+
+
+def _to_text(data):
+    if isinstance(data, bytes):
+        return data.decode('ascii', 'ignore')
+    return data
+
+
+def iter_log_chunks(log):
+    """
+    Yield the text of log (stdout and stderr, not headers) a chunk at
+    a time.
+    """
+    get_chunks = getattr(log, 'getChunks', None)
+    if get_chunks is not None:
+        # With onlyText, getChunks() yields just the text of each chunk
+        # on the channels asked for.
+        for data in get_chunks([log.STDOUT, log.STDERR], onlyText=True):
+            yield _to_text(data)
+        return
+    text = _to_text(log.getText())
+    for start in range(0, len(text), CHUNK_SIZE):
+        yield text[start:start + CHUNK_SIZE]
+
+
+def search_log(log, needles):
+    """
+    Return the first of needles (a string or a list of them) found in
+    log, or None.  Finds them across chunk boundaries too.
+    """
+    if isinstance(needles, str):
+        needles = [needles]
+    overlap = max(len(needle) for needle in needles) - 1
+    carry = ''
+    for chunk in iter_log_chunks(log):
+        window = carry + chunk
+        for needle in needles:
+            if needle in window:
+                return needle
+        carry = window[-overlap:] if overlap > 0 else ''
+    return None
+
+
+def tail_log(log, max_lines=100, max_chars=100000):
+    """
+    Return (text, truncated): the whole text of log if it is at most
+    max_chars long, and otherwise only its last max_lines lines with
+    truncated True.
+    """
+    head = []
+    size = 0
+    lines = None
+    partial = ''
+    for chunk in iter_log_chunks(log):
+        if lines is None:
+            size += len(chunk)
+            head.append(chunk)
+            if size <= max_chars:
+                continue
+            # Too big to send whole: from now on only keep a window
+            # of the last lines.
+            chunk = ''.join(head)
+            head = None
+            lines = deque(maxlen=max_lines)
+        parts = (partial + chunk).split('\n')
+        # Don't let one enormous line defeat the bound.
+        partial = parts.pop()[-max_chars:]
+        lines.extend(line[-max_chars:] for line in parts)
+
+    if lines is None:
+        return ''.join(head), False
+    lines.append(partial)
+    return '\n'.join(lines), True
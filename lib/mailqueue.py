@@ -0,0 +1,266 @@
+# Asynchronous delivery of notification emails.
+#
+# Sending mail used to mean a blocking smtplib.SMTP('localhost') per
+# message, in the middle of master code, so a slow or dead MTA stalled
+# the master.  A MailQueue instead spools each message to disk and
+# returns at once; a background thread delivers the spool over a single
+# SMTP connection that is kept open between messages (and closed after
+# a while idle), at no more than max_rate messages per second.
+#
+# Failed deliveries are retried with exponential backoff.  Messages the
+# server rejects outright, or that still fail after max_attempts, are
+# moved to the failed/ subdirectory of the spool for someone to look at.
+# As the spool lives on disk, messages survive a master restart and are
+# sent once the queue starts again.
+#
+# host and port can point the queue at any SMTP server, e.g. a local
+# stand-in such as "python -m aiosmtpd -n -l localhost:8025", and
+# run_once() delivers what is due without the background thread.
+
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+
+from atomicfile import write_atomically
+
+log = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """
+    Persistent outbound mail queue spooled under spooldir.
+    """
+    def __init__(self, spooldir, host='localhost', port=25, max_rate=2.0,
+                 max_attempts=10, backoff=30.0, max_backoff=3600.0,
+                 idle_timeout=60.0, timeout=30.0):
+        self.spooldir = spooldir
+        self.faileddir = os.path.join(spooldir, 'failed')
+        os.makedirs(self.faileddir, exist_ok=True)
+        self.host = host
+        self.port = port
+        self.max_rate = max_rate
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self.connection = None
+        self.last_used = 0.0
+        self.last_sent = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def enqueue(self, sender, recipients, message):
+        """
+        Spool message (a str, e.g. from MIMEText.as_string()) for
+        delivery from sender to the list of recipients, and return its
+        id.  Returns as soon as the message is safely on disk.
+        """
+        msgid = '{:.6f}-{}'.format(time.time(), uuid.uuid4().hex)
+        entry = {'sender': sender,
+                 'recipients': list(recipients),
+                 'message': message,
+                 'attempts': 0,
+                 'next_attempt': 0.0}
+        write_atomically(os.path.join(self.spooldir, msgid + '.msg'),
+                         json.dumps(entry), fsync=True)
+        self.wakeup.set()
+        return msgid
+
+    def pending(self):
+        """
+        Return the ids of the spooled messages, oldest first.
+        """
+        return sorted(name[:-len('.msg')] for name in os.listdir(self.spooldir)
+                      if name.endswith('.msg'))
+
+    def _load(self, msgid):
+        try:
+            with open(os.path.join(self.spooldir, msgid + '.msg')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _connect(self):
+        if self.connection is not None:
+            if time.time() - self.last_used < 10:
+                return self.connection
+            # It may have been dropped while idle.
+            try:
+                self.connection.noop()
+                return self.connection
+            except (smtplib.SMTPException, OSError):
+                self._disconnect()
+        self.connection = smtplib.SMTP(self.host, self.port,
+                                       timeout=self.timeout)
+        return self.connection
+
+    def _disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def _throttle(self):
+        if self.max_rate:
+            delay = self.last_sent + 1.0 / self.max_rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        self.last_sent = time.time()
+
+    def _deliver(self, msgid, entry):
+        """
+        Try to send one message; returns False if the server couldn't
+        be reached, so the rest of the queue should wait too.
+        """
+        path = os.path.join(self.spooldir, msgid + '.msg')
+        self._throttle()
+        try:
+            connection = self._connect()
+            refused = connection.sendmail(entry['sender'], entry['recipients'],
+                                          entry['message'])
+        except smtplib.SMTPRecipientsRefused as e:
+            # Nobody got it; e.recipients has each recipient's reply.
+            return self._refused(msgid, entry, e.recipients)
+        except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            if 400 <= e.smtp_code < 500:
+                return self._retry(msgid, entry, str(e))
+            # Permanently rejected; no point trying again.
+            self._fail(msgid, entry, str(e))
+            return True
+        except (smtplib.SMTPException, OSError) as e:
+            self._disconnect()
+            self._retry(msgid, entry, str(e))
+            return False
+        self.last_used = time.time()
+        self.sent += 1
+        if refused:
+            return self._refused(msgid, entry, refused)
+        os.remove(path)
+        return True
+
+    def _refused(self, msgid, entry, refused):
+        """
+        Handle the recipients that the server refused, a dict from
+        recipient to (code, message): try again later for those refused
+        temporarily (4xx), and give up on the rest.
+        """
+        for recipient, (code, message) in refused.items():
+            if isinstance(message, bytes):
+                message = message.decode('utf-8', 'replace')
+            entry.setdefault('refused', {})[recipient] = [code, message]
+        temporary = [recipient for recipient, (code, _) in refused.items()
+                     if 400 <= code < 500]
+        if temporary:
+            # The rest have it, or never will.
+            entry['recipients'] = temporary
+            return self._retry(msgid, entry, 'recipients refused for now: '
+                               + ', '.join(temporary))
+        self._fail(msgid, entry, 'recipients refused')
+        return True
+
+    def _retry(self, msgid, entry, error):
+        entry['attempts'] += 1
+        entry['last_error'] = error
+        if entry['attempts'] >= self.max_attempts:
+            self._fail(msgid, entry, error)
+            return True
+        delay = min(self.backoff * 2 ** (entry['attempts'] - 1),
+                    self.max_backoff)
+        entry['next_attempt'] = time.time() + delay
+        write_atomically(os.path.join(self.spooldir, msgid + '.msg'),
+                         json.dumps(entry), fsync=True)
+        return True
+
+    def _fail(self, msgid, entry, error):
+        entry['last_error'] = error
+        write_atomically(os.path.join(self.faileddir, msgid + '.msg'),
+                         json.dumps(entry), fsync=True)
+        os.remove(os.path.join(self.spooldir, msgid + '.msg'))
+        self.failed += 1
+
+    def run_once(self):
+        """
+        Deliver every spooled message that is due.  Returns the time
+        the next one will be due, or None if the spool is empty.
+        """
+        next_due = None
+        for msgid in self.pending():
+            if self.stopping:
+                break
+            entry = self._load(msgid)
+            if entry is None:
+                continue
+            try:
+                if entry['next_attempt'] <= time.time():
+                    if not self._deliver(msgid, entry):
+                        # The server is unreachable: back off the whole
+                        # queue.
+                        due = time.time() + self.backoff
+                        return due if next_due is None else min(next_due, due)
+                    if not os.path.exists(os.path.join(self.spooldir,
+                                                       msgid + '.msg')):
+                        continue
+                due = entry['next_attempt']
+            except Exception as e:
+                # A broken entry mustn't hold up the rest of the queue.
+                log.exception('cannot deliver spooled message %s', msgid)
+                try:
+                    self._fail(msgid, entry, 'internal error: {!r}'.format(e))
+                except Exception:
+                    log.exception('cannot move %s out of the spool', msgid)
+                continue
+            next_due = due if next_due is None else min(next_due, due)
+        return next_due
+
+    def _run(self):
+        while not self.stopping:
+            # Clear before looking at the spool, so that a message
+            # enqueued while we do still wakes us up.
+            self.wakeup.clear()
+            try:
+                next_due = self.run_once()
+            except Exception:
+                # e.g. the spool directory can't be listed; try again
+                # later rather than let the thread die.
+                log.exception('mail queue delivery failed')
+                next_due = time.time() + self.backoff
+            now = time.time()
+            if self.connection is not None \
+               and now - self.last_used > self.idle_timeout:
+                self._disconnect()
+            wait = self.idle_timeout
+            if next_due is not None:
+                wait = min(wait, max(0.0, next_due - now))
+            self.wakeup.wait(wait)
+        self._disconnect()
+
+    def start(self):
+        """
+        Start delivering in a background thread.
+        """
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run,
+                                           name='mail-queue', daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background thread; undelivered messages stay spooled.
+        """
+        if self.thread is not None:
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join(timeout)
+            self.thread = None
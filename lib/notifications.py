@@ -1,10 +1,71 @@
 # This file has all the services related to email notification.
 
-import smtplib
+import os
 import socket
+from urllib.parse import quote
 from email.mime.text import MIMEText
+from twisted.internet import reactor
 from buildbot.interfaces import IEmailLookup
+from buildbot.process.results import FAILURE, Results
 from zope.interface import implementer
+from mailqueue import MailQueue
+from notifystate import NotificationState
+from tryjobindex import TryJobAddressIndex
+from logaccess import search_log, tail_log
+from digest import DigestNotifier
+
+# Outgoing mail is spooled here and delivered in the background, so
+# that a slow or unreachable MTA never holds up the master.
+_mail_queue = None
+
+def get_mail_queue ():
+    global _mail_queue
+    if _mail_queue is None:
+        _mail_queue = MailQueue (os.path.expanduser ("~/mail-queue"))
+        _mail_queue.start ()
+        # Let a delivery in progress finish before the master exits;
+        # anything still spooled is sent after the restart.
+        reactor.addSystemEventTrigger ('before', 'shutdown',
+                                       _mail_queue.stop, 30)
+    return _mail_queue
+
+# Which root messages and breakage reports have already been sent.
+_notification_state = None
+
+def get_notification_state ():
+    global _notification_state
+    if _notification_state is None:
+        _notification_state = NotificationState (os.path.expanduser ("~/notifications.db"))
+    return _notification_state
+
+# When enabled, the results of every builder for a commit are sent as
+# one digest instead of a root message plus one message per builder.
+_digest = None
+
+def enable_digest (window = 600, expected_builders = None):
+    """Gather results per commit for WINDOW seconds, or until all of
+EXPECTED_BUILDERS have reported, and send them as one message.  The
+results not sent yet are kept next to the notification state, so that
+a restart doesn't lose them."""
+    global _digest, GCC_MAIL_TO, GCC_MAIL_FROM
+    if _digest is None:
+        _digest = DigestNotifier (get_mail_queue ().enqueue,
+                                  GCC_MAIL_FROM, [ GCC_MAIL_TO ],
+                                  window = window,
+                                  expected_builders = expected_builders,
+                                  statepath = os.path.expanduser ("~/digest.json"))
+    else:
+        _digest.window = window
+        _digest.expected_builders = set (expected_builders or [])
+    return _digest
+
+def disable_digest ():
+    """Go back to one message per build, sending what the digest has
+gathered so far."""
+    global _digest
+    if _digest is not None:
+        _digest.flush_all ()
+        _digest = None
 
 def SendRootMessageGCCTesters (branch, change, rev,
                                istrysched = False,
@@ -12,17 +73,14 @@ def SendRootMessageGCCTesters (branch, change, rev,
     global GCC_MAIL_TO, GCC_MAIL_FROM
 
     if istrysched:
-        f = "/tmp/gcc-buildbot-%s-try.lock" % rev
+        key = "root-try:%s" % rev
     else:
-        f = "/tmp/gcc-buildbot-%s.lock" % rev
+        key = "root:%s" % rev
 
-    if os.path.exists (f):
+    if not get_notification_state ().check_and_set (key):
         # The message has already been sent
         return
 
-    # WE HAVE TO REMEMBER TO CLEAN THESE FILES REGULARLY
-    open (f, 'w').close ()
-
     if not istrysched:
         text = ""
         text += "*** TEST RESULTS FOR COMMIT %s ***\n\n" % rev
@@ -66,32 +124,26 @@ def SendRootMessageGCCTesters (branch, change, rev,
         mailto = try_to
         mail['Message-Id'] = "<%s-try@gcc-build>" % rev
 
-    s = smtplib.SMTP ('localhost')
-    s.sendmail (GCC_MAIL_FROM, [ mailto ], mail.as_string ())
-    s.quit ()
+    get_mail_queue ().enqueue (GCC_MAIL_FROM, [ mailto ], mail.as_string ())
 
-def make_breakage_lockfile_prefix ():
-    return "/tmp/gcc-buildbot-breakage-report-"
+def make_breakage_key (name):
+    return "breakage:%s" % name
 
 def SendAuthorMessage (name, change, text_prepend):
     """Send a message to the author of the commit if it broke GCC.
 
-We use a lock file to avoid reporting the breakage to different
-people.  This may happen, for example, if a commit X breaks GCC, but
+We record the report in the notification state to avoid reporting
+the breakage to different people.  This may happen, for example, if a commit X breaks GCC, but
 subsequent commits are made after X, by different people."""
     global GCC_MAIL_FROM
 
-    lockfile = "%s%s" % (make_breakage_lockfile_prefix (), name)
-
-    if os.path.exists (lockfile):
+    # This is cleared the next time we run MessageGCCTesters, iff the
+    # build breakage has been fixed.
+    if not get_notification_state ().check_and_set (make_breakage_key (name)):
         # This means we have already reported this failure for this
         # builder to the author.
         return
 
-    # This file will be cleaned the next time we run
-    # MessageGCCTesters, iff the build breakage has been fixed.
-    open (lockfile, 'w').close ()
-
     rev = change.revision
     to = change.who.encode ('ascii', 'ignore').decode ('ascii')
     title = change.comments.split ('\n')[0]
@@ -114,21 +166,76 @@ subsequent commits are made after X, by different people."""
     mail['From'] = GCC_MAIL_FROM
     mail['To'] = to
 
-    s = smtplib.SMTP ('localhost')
-    s.sendmail (GCC_MAIL_FROM, [ to ], mail.as_string ())
-    s.quit ()
+    get_mail_queue ().enqueue (GCC_MAIL_FROM, [ to ], mail.as_string ())
+
+def describe_failure_classification (properties):
+    """Describe the likely causes of a failure, as found by the
+FailureObserver of the failed steps, or return ''."""
+    classification = properties.getProperty ('failure_classification')
+    if not classification:
+        return ""
+    text = "\n*** Likely cause of the failure ***\n\n"
+    for name in sorted (classification):
+        match = classification[name]
+        steps = ', '.join ("'%s'" % step for step in match['steps'])
+        text += "\t%s (%d matching line(s) in %s, first:\n\t  %s)\n" % (match['description'], match['count'], steps, match['example'])
+    return text
+
+def ran_out_of_space (properties, log):
+    """Whether the failed step that LOG belongs to ran out of disk space.
+Steps with a FailureObserver were classified while their logs streamed
+by; only the logs of the other steps have to be searched."""
+    step = log.getStep ().getName ()
+    classification = properties.getProperty ('failure_classification') or {}
+    enospc = classification.get ('enospc')
+    if enospc and step in enospc['steps']:
+        return True
+    if step in (properties.getProperty ('failure_classified_steps') or []):
+        return False
+    return search_log (log, 'No space left on device') is not None
+
+# Where GccCatSumfileCommand commits every build's results (one branch
+# per builder and branch), and where the xfail lists come from.
+RESULTS_GIT_URL = "http://gcc-build.sergiodj.net/cgit/results.git"
+XFAILS_GIT_URL = "http://git.sergiodj.net/?p=gcc-xfails.git"
+
+def describe_results_link (properties):
+    """Point to the results that the build committed to results.git, as
+recorded in its 'results_branch' and 'results_commit' properties."""
+    commit = properties.getProperty ('results_commit')
+    if not commit:
+        return "\t<No results were published for this build>\n"
+    return "\t<%s/tree/?h=%s&id=%s>\n" % (RESULTS_GIT_URL,
+                                          quote (properties.getProperty ('results_branch')),
+                                          commit)
+
+def describe_xfail_links (name, branch, properties):
+    """Point to the xfail list that the build's results were compared
+with, as recorded in its 'xfail_commit' property."""
+    text = "\n\n*** Complete list of XFAILs for this builder ***\n\n"
+    com = properties.getProperty ('xfail_commit')
+    if not com:
+        text += "FAILURE TO OBTAIN THE COMMIT FOR THE XFAIL LIST.  PLEASE CONTACT THE BUILDBOT ADMIN.\n"
+        return text
+    text += "To obtain the list of XFAIL tests for this builder, go to:\n\n"
+    text += "\t<%s;a=blob;f=xfails/%s/xfails/%s/xfail;hb=%s>\n\n" % (XFAILS_GIT_URL, name, branch, com)
+    text += "You can also see a pretty-printed version of the list, with more information\n"
+    text += "about each XFAIL, by going to:\n\n"
+    text += "\t<%s;a=blob;f=xfails/%s/xfails/%s/xfail.table;hb=%s>\n" % (XFAILS_GIT_URL, name, branch, com)
+    return text
 
 def MessageGCCTesters (mode, name, build, results, master_status):
     """This function is responsible for composing the message that will be
 send to the gcc-testers mailing list."""
-    git_url = "http://gcc-build.sergiodj.net/cgit"
     branch = build.getSourceStamps ()[0].branch
     cur_change = build.getSourceStamps ()[0].changes[0]
     properties = build.getProperties ()
     isrebuild = properties.getProperty ('isRebuild')
 
-    # Sending the root message to gcc-testers.
-    SendRootMessageGCCTesters (branch, cur_change, cur_change.revision)
+    # Sending the root message to gcc-testers, unless the digest
+    # takes care of the commit.
+    if _digest is None:
+        SendRootMessageGCCTesters (branch, cur_change, cur_change.revision)
 
     # Subject
     subj = "Failures on %s, branch %s" % (name, branch)
@@ -163,14 +270,8 @@ send to the gcc-testers mailing list."""
     text += "\t%s\n" % cur_change.comments.split ('\n')[0]
 
     # URL to find more info about what went wrong.
-    text += "\nTestsuite log (gcc.sum and gcc.log) URL(s):\n"
-    for ss in ss_list:
-        commit_id = get_builder_commit_id (name, ss.revision, ss.branch)
-        if commit_id:
-            text += "\t<%s/%s/.git/tree/?h=%s&id=%s>\n" % (git_url, name, quote (ss.branch),
-                                                           commit_id)
-        else:
-            text += "\t<Error fetching commit ID for %s>\n" % ss.revision
+    text += "\nTestsuite results (gcc.sum) URL:\n"
+    text += describe_results_link (properties)
 
     # Including the 'regressions' log.  This is the 'diff' of what
     # went wrong.
@@ -193,7 +294,7 @@ send to the gcc-testers mailing list."""
         st = log.getStep ()
         if st.getResults ()[0] == FAILURE:
             n = st.getName ()
-            if 'No space left on device' in log.getText ():
+            if ran_out_of_space (properties, log):
                 text += "*** Internal error on buildworker (no space left on device). ***\n"
                 text += "*** Please report this to the buildworker owner (see <%s/buildworker/%s>) ***\n\n" % (master_status.getBuildbotURL (), build.getWorkername ())
                 continue
@@ -214,15 +315,11 @@ send to the gcc-testers mailing list."""
             elif n == 'compile gcc':
                 text += "*** Failed to compiled GCC.  ***\n"
                 text += "============================\n"
-                ct = log.getText ().decode ('ascii', 'ignore')
-                if len (ct) > 100000:
+                ct, truncated = tail_log (log, max_lines = 100, max_chars = 100000)
+                if truncated:
                     text += "\n+++ The full log is too big to be posted here."
                     text += "\n+++ These are the last 100 lines of it.\n\n"
-                    ctt = ct.split ('\n')[-100:]
-                    ct = '\n'.join (ctt)
-                    text += ct
-                else:
-                    text += ct
+                text += ct
                 text += "============================\n"
                 subj = "*** COMPILATION FAILED *** " + subj
                 report_build_breakage = True
@@ -232,25 +329,18 @@ send to the gcc-testers mailing list."""
                 text += "============================\n"
                 text += log.getText ()
                 text += "============================\n"
+                if any (l.getName () == 'regressions-full' for l in build.getLogs ()):
+                    text += "(Only a summary is shown.  The complete diff is in the\n"
+                    text += "'regressions-full' log of this build.)\n"
                 found_regressions = True
                 break
 
+    text += describe_failure_classification (properties)
+
     # Including the 'xfail' log.  It is important to say which tests
     # we are ignoring.
     if found_regressions:
-        if os.path.exists (os.path.join (gcc_web_base, name)):
-            xfail_commit = os.path.join (gcc_web_base, name, 'xfails', branch, '.last-commit')
-            text += "\n\n*** Complete list of XFAILs for this builder ***\n\n"
-            if os.path.exists (xfail_commit):
-                with open (xfail_commit, 'r') as f:
-                    com = f.read ().strip ('\n')
-                    text += "To obtain the list of XFAIL tests for this builder, go to:\n\n"
-                    text += "\t<http://git.sergiodj.net/?p=gcc-xfails.git;a=blob;f=xfails/%s/xfails/%s/xfail;hb=%s>\n\n" % (name, branch, com)
-                    text += "You can also see a pretty-printed version of the list, with more information\n"
-                    text += "about each XFAIL, by going to:\n\n"
-                    text += "\t<http://git.sergiodj.net/?p=gcc-xfails.git;a=blob;f=xfails/%s/xfails/%s/xfail.table;hb=%s>\n" % (name, branch, com)
-            else:
-                text += "FAILURE TO OBTAIN THE COMMIT FOR THE XFAIL LIST.  PLEASE CONTACT THE BUILDBOT ADMIN.\n"
+        text += describe_xfail_links (name, branch, properties)
     text += "\n"
 
     if report_build_breakage:
@@ -258,11 +348,12 @@ send to the gcc-testers mailing list."""
         SendAuthorMessage (name, cur_change, text)
     else:
         # There is no build breakage anymore!  Yay!  Now, let's see if
-        # we need to clean up any lock file from previous breaks.
-        lockfile = "%s%s" % (make_breakage_lockfile_prefix (), name)
-        if os.path.exists (lockfile):
-            # We need to clean the lockfile.  Garbage-collect it here.
-            os.remove (lockfile)
+        # we need to forget about previous breaks.
+        get_notification_state ().discard (make_breakage_key (name))
+
+    if _digest is not None:
+        _digest.add (cur_change.revision, branch, cur_change.who,
+                     cur_change.comments, name, Results[results], subj, text)
 
     return { 'body' : text,
              'type' : 'plain',
@@ -271,7 +362,6 @@ send to the gcc-testers mailing list."""
 def MessageGCCTestersTryBuild (mode, name, build, results, master_status):
     """This function is responsible for composing the message that will be
 send to the gcc-testers mailing list."""
-    git_url = "http://gcc-build.sergiodj.net/cgit"
     branch = build.getSourceStamps ()[0].branch
     sourcestamp = build.getSourceStamps ()[0]
     cur_change = sourcestamp.patch[1]
@@ -303,15 +393,8 @@ send to the gcc-testers mailing list."""
     text += "\t%s\n" % sourcestamp.revision
 
     # URL to find more info about what went wrong.
-    text += "\nTestsuite log (gcc.sum and gcc.log) URL(s):\n"
-    commit_id = get_builder_commit_id (name, sourcestamp.revision,
-                                       sourcestamp.branch)
-    if commit_id:
-        text += "\t<%s/%s/.git/tree/?h=%s&id=%s>\n" % (git_url, name,
-                                                       quote (sourcestamp.branch),
-                                                       commit_id)
-    else:
-        text += "\t<Error fetching commit ID for %s>\n" % sourcestamp.revision
+    text += "\nTestsuite results (gcc.sum) URL:\n"
+    text += describe_results_link (properties)
 
     # found_regressions will be True if the 'regressions' log is not
     # empty.
@@ -325,7 +408,7 @@ send to the gcc-testers mailing list."""
                 text += "\nCongratulations!  No regressions were found in this build!\n\n"
                 break
         if st.getResults ()[0] == FAILURE:
-            if 'No space left on device' in log.getText ():
+            if ran_out_of_space (properties, log):
                 text += "*** Internal error on buildslave (no space left on device). ***\n"
                 text += "*** Please report this to the buildslave owner (see <%s/buildslaves/%s>) ***\n\n" % (master_status.getBuildbotURL (), build.getSlavename ())
                 continue
@@ -345,15 +428,11 @@ send to the gcc-testers mailing list."""
             elif n == 'compile gcc':
                 text += "*** Failed to compiled GCC.  ***\n"
                 text += "============================\n"
-                ct = log.getText ().decode ('ascii', 'ignore')
-                if len (ct) > 100000:
+                ct, truncated = tail_log (log, max_lines = 100, max_chars = 100000)
+                if truncated:
                     text += "\n+++ The full log is too big to be posted here."
                     text += "\n+++ These are the last 100 lines of it.\n\n"
-                    ctt = ct.split ('\n')[-100:]
-                    ct = '\n'.join (ctt)
-                    text += ct
-                else:
-                    text += ct
+                text += ct
                 text += "============================\n"
                 subj = "*** COMPILATION FAILED *** " + subj
                 break
@@ -362,25 +441,18 @@ send to the gcc-testers mailing list."""
                 text += "============================\n"
                 text += log.getText ()
                 text += "============================\n"
+                if any (l.getName () == 'regressions-full' for l in build.getLogs ()):
+                    text += "(Only a summary is shown.  The complete diff is in the\n"
+                    text += "'regressions-full' log of this build.)\n"
                 found_regressions = True
                 break
 
+    text += describe_failure_classification (properties)
+
     # Including the 'xfail' log.  It is important to say which tests
     # we are ignoring.
     if found_regressions:
-        if os.path.exists (os.path.join (gcc_web_base, name)):
-            xfail_commit = os.path.join (gcc_web_base, name, 'xfails', branch, '.last-commit')
-            text += "\n\n*** Complete list of XFAILs for this builder ***\n\n"
-            if os.path.exists (xfail_commit):
-                with open (xfail_commit, 'r') as f:
-                    com = f.read ().strip ('\n')
-                    text += "To obtain the list of XFAIL tests for this builder, go to:\n\n"
-                    text += "\t<http://git.sergiodj.net/?p=gcc-xfails.git;a=blob;f=xfails/%s/xfails/%s/xfail;hb=%s>\n\n" % (name, branch, com)
-                    text += "You can also see a pretty-printed version of the list, with more information\n"
-                    text += "about each XFAIL, by going to:\n\n"
-                    text += "\t<http://git.sergiodj.net/?p=gcc-xfails.git;a=blob;f=xfails/%s/xfails/%s/xfail.table;hb=%s>\n" % (name, branch, com)
-            else:
-                text += "FAILURE TO OBTAIN THE COMMIT FOR THE XFAIL LIST.  PLEASE CONTACT THE BUILDBOT ADMIN.\n"
+        text += describe_xfail_links (name, branch, properties)
     text += "\n"
 
     return { 'body' : text,
@@ -390,7 +462,30 @@ send to the gcc-testers mailing list."""
 from buildbot.reporters import mail
 
 class MyMailNotifier (mail.MailNotifier):
-    """Extend the regular MailNotifier class in order to filter e-mails by scheduler."""
+    """Extend the regular MailNotifier class in order to filter e-mails by scheduler.
+
+With DIGEST_WINDOW set, results for the same commit are gathered for
+that many seconds (or until every builder in DIGEST_BUILDERS has
+reported) and sent as one digest, instead of one message per build."""
+    def checkConfig (self, *args, digest_window = None, digest_builders = None, **kwargs):
+        mail.MailNotifier.checkConfig (self, *args, **kwargs)
+
+    def reconfigService (self, *args, digest_window = None, digest_builders = None, **kwargs):
+        self.digest = None
+        # Only the notifier for the regular builds owns the digest.
+        if "TRY" not in (kwargs.get ('tags') or []):
+            if digest_window is not None:
+                self.digest = enable_digest (digest_window, digest_builders)
+            else:
+                disable_digest ()
+        return mail.MailNotifier.reconfigService (self, *args, **kwargs)
+
+    def sendMessage (self, *args, **kwargs):
+        if getattr (self, 'digest', None) is not None:
+            # MessageGCCTesters has added this build to the digest.
+            return
+        return mail.MailNotifier.sendMessage (self, *args, **kwargs)
+
     def isMailNeeded (self, build, results):
         prop = build.properties.getProperty ('scheduler')
         if prop.startswith ('racy'):
@@ -410,16 +505,9 @@ class MyMailNotifier (mail.MailNotifier):
 @implementer(IEmailLookup)
 class LookupEmailTryBuild (object):
 
+    def __init__ (self):
+        self.index = TryJobAddressIndex (os.path.expanduser ("~/try_ssh_jobdir"))
+
     def getAddress (self, name):
-        # List of [ dir, sorted_reverse ]
-        tryjobdir = [ [ os.path.expanduser ("~/try_ssh_jobdir/new/"), False ],
-                      [ os.path.expanduser ("~/try_ssh_jobdir/cur/"), True ] ]
-        name_re = re.compile (".*(%s <.*@.*>),.*" % name, flags = re.UNICODE)
-        for directory, sort_order in tryjobdir:
-            for _, _, filenames in os.walk (directory):
-                for f in sorted (filenames, reverse = sort_order):
-                    with open (os.path.join (directory, f), 'r') as myf:
-                        for line in reversed (myf.readlines ()):
-                            m = re.match (name_re, line)
-                            if m:
-                                return m.group (1)
+        self.index.update ()
+        return self.index.lookup (name)
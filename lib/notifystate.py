@@ -0,0 +1,100 @@
+# Persistent record of which notifications have been sent.
+#
+# The notifiers must not send the same root message twice for a
+# revision, nor tell an author again about a breakage they were already
+# told about.  That used to be done with lock files in /tmp, which
+# nothing ever cleaned up and which were lost on reboot.  Now it is a
+# small SQLite database, in WAL mode so that readers don't block the
+# writer, keyed by a primary-key index so that a lookup costs the same
+# however many revisions have been seen.
+#
+# Entries expire after ttl seconds and the table is capped at
+# max_entries rows, oldest first, so it can't grow without bound.
+
+import sqlite3
+import threading
+import time
+
+
+class NotificationState:
+    """
+    Set of notification keys, with an expiry time, stored at path.
+    """
+    # check_and_set() calls between evictions.
+    EVICT_EVERY = 100
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS sent ('
+                        ' key TEXT PRIMARY KEY,'
+                        ' created REAL NOT NULL'
+                        ') WITHOUT ROWID')
+        self.db.execute('CREATE INDEX IF NOT EXISTS sent_created'
+                        ' ON sent (created)')
+        self.sets = 0
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def check_and_set(self, key):
+        """
+        Record key and return True, unless it is already recorded (and
+        hasn't expired), in which case return False.  Atomic, even
+        between processes sharing the database.
+        """
+        now = time.time()
+        with self.lock:
+            # Not an upsert, which needs SQLite 3.24: insert the key if
+            # it's new, else renew it if it has expired, in a write
+            # transaction so that no other process can get in between.
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self.db.execute(
+                    'INSERT OR IGNORE INTO sent (key, created) VALUES (?, ?)',
+                    (key, now))
+                recorded = cursor.rowcount == 1
+                if not recorded:
+                    cursor = self.db.execute(
+                        'UPDATE sent SET created = ?'
+                        ' WHERE key = ? AND created < ?',
+                        (now, key, now - self.ttl))
+                    recorded = cursor.rowcount == 1
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.sets += 1
+            if self.sets % self.EVICT_EVERY == 0:
+                self._evict(now)
+            return recorded
+
+    def contains(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT created FROM sent WHERE key = ?',
+                                  (key,)).fetchone()
+        return row is not None and row[0] >= time.time() - self.ttl
+
+    def discard(self, key):
+        with self.lock:
+            self.db.execute('DELETE FROM sent WHERE key = ?', (key,))
+
+    def _evict(self, now):
+        self.db.execute('DELETE FROM sent WHERE created < ?',
+                        (now - self.ttl,))
+        self.db.execute('DELETE FROM sent WHERE key IN ('
+                        ' SELECT key FROM sent ORDER BY created DESC'
+                        ' LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def evict(self):
+        """
+        Drop expired entries, and the oldest ones beyond max_entries.
+        """
+        with self.lock:
+            self._evict(time.time())
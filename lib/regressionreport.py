@@ -0,0 +1,108 @@
+# Bounded-size summaries of regression reports.
+#
+# A bad commit can turn tens of thousands of tests from PASS to FAIL,
+# and pasting that whole report into a step log and an email helps
+# nobody.  A RegressionReport reads a full report (one change per line,
+# as DejaResults.compute_regressions produces) and groups the changes
+# by the .exp file that ran them, or failing that by the directory of
+# the test, so that summary() can give the count per group and kind of
+# change followed by a capped list of details.  The full report is
+# still kept, separately, for those who need it.
+
+import os
+import re
+from collections import Counter, OrderedDict
+
+# The first path-like token on a line, e.g. gcc.dg/vect/pr123.c.
+_PATH_RE = re.compile(r'[\w.+-]+(?:/[\w.+-]+)+')
+
+# "Running /path/to/testsuite/gcc.dg/vect/vect.exp ..."
+_RUNNING_RE = re.compile(r'^Running (\S+\.exp) \.\.\.')
+
+
+def map_test_paths_to_exp(sum_text):
+    """
+    Return a dict from the test file paths in a .sum to the .exp file
+    that ran them (relative to the testsuite directory where possible).
+    """
+    result = {}
+    exp = None
+    for line in sum_text.splitlines():
+        m = _RUNNING_RE.match(line)
+        if m:
+            exp = m.group(1)
+            marker = exp.rfind('/testsuite/')
+            if marker >= 0:
+                exp = exp[marker + len('/testsuite/'):]
+            continue
+        if exp is not None and ': ' in line:
+            m = _PATH_RE.search(line)
+            if m:
+                result.setdefault(m.group(0), exp)
+    return result
+
+
+class RegressionReport:
+    """
+    Changes from a regression report, grouped by .exp file or directory.
+    sum_text, the .sum the report is about, tells which .exp ran which
+    test; without it changes are grouped by directory.
+    """
+    def __init__(self, report, sum_text=None, max_details=200,
+                 max_groups=50):
+        self.report = report
+        self.max_details = max_details
+        self.max_groups = max_groups
+        self.total = 0
+        self.details = []
+        # group -> Counter of kinds of change
+        self.groups = OrderedDict()
+
+        exp_of = map_test_paths_to_exp(sum_text) if sum_text else {}
+        for line in report.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            m = _PATH_RE.search(line)
+            if m:
+                path = m.group(0)
+                group = exp_of.get(path) or os.path.dirname(path) or path
+                kind = line[:m.start()].strip(' :') or 'changed'
+            else:
+                group = '(other)'
+                kind = 'changed'
+            self.groups.setdefault(group, Counter())[kind] += 1
+            self.total += 1
+            if len(self.details) < max_details:
+                self.details.append(line)
+
+    def __len__(self):
+        return self.total
+
+    def is_truncated(self):
+        return self.total > len(self.details)
+
+    def summary(self):
+        """
+        Return the report as counts per group, largest first, followed
+        by at most max_details of the individual changes.
+        """
+        lines = ['{} changes in {} groups'.format(self.total, len(self.groups)),
+                 '']
+        groups = sorted(self.groups.items(),
+                        key=lambda item: (-sum(item[1].values()), item[0]))
+        for group, kinds in groups[:self.max_groups]:
+            lines.append('{:6} {}  ({})'.format(
+                sum(kinds.values()), group,
+                ', '.join('{}: {}'.format(kind, count)
+                          for kind, count in kinds.most_common())))
+        if len(groups) > self.max_groups:
+            lines.append('   ... and {} more groups'
+                         .format(len(groups) - self.max_groups))
+
+        lines.append('')
+        lines.extend(self.details)
+        if self.is_truncated():
+            lines.append('... and {} more changes; see the full report'
+                         .format(self.total - len(self.details)))
+        return '\n'.join(lines) + '\n'
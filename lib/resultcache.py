@@ -0,0 +1,228 @@
+# On-disk cache of parsed dejagnu .sum files.
+#
+# Parsing a full gcc.sum is expensive, and the same baselines and
+# previous sums are parsed again on every build.  A ResultsCache keeps
+# the parse_columns() output for each file in a small compressed
+# entry, so that re-reading an unchanged file costs a single read of
+# that entry.
+#
+# Entries are named by a hash of the file's content, so identical
+# copies of a file (e.g. gcc.sum and previous_gcc.sum) share one.  A
+# tiny "ref" file keyed by the file's path, size and mtime points at
+# the entry, so that an unchanged file doesn't even need to be read to
+# be hashed.  The cache is kept under max_bytes by evicting the least
+# recently used files; the directory is only gone through when what has
+# been written since the last eviction may have taken it over.
+#
+# Install one with dejagnu.set_results_cache() to have SumFile and
+# TestRun use it transparently.
+
+import hashlib
+import os
+import struct
+import zlib
+from array import array
+
+from atomicfile import TMP_SUFFIX, write_atomically
+from dejagnu import parse_columns, parse_columns_text
+
+
+def hash_content(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def hash_file_content(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _touch(path):
+    # Mark path as recently used.  Someone else's evict() may have
+    # removed it since we read it, which is no reason to fail.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class ResultsCache:
+    """
+    Size-bounded LRU cache of parse_columns() results, in cachedir.
+    """
+    MAGIC = b'DJRES001'
+
+    # magic, number of results, length of the names blob
+    HEADER = struct.Struct('=8sII')
+
+    def __init__(self, cachedir, max_bytes=256 * 1024 * 1024):
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        os.makedirs(cachedir, exist_ok=True)
+        # Bytes in the cache as of the last evict(), plus what this
+        # process has written since; None until the first evict().
+        self.size = None
+
+    def _ref_path(self, path, st):
+        key = '{}\0{}\0{}'.format(os.path.abspath(path), st.st_size,
+                                  st.st_mtime_ns)
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogateescape'),
+                                 digest_size=20).hexdigest()
+        return os.path.join(self.cachedir, digest + '.ref')
+
+    def _entry_path(self, content_hash):
+        return os.path.join(self.cachedir, content_hash + '.res')
+
+    def load(self, path):
+        """
+        Return the cached columns for the file at path, or None.  This
+        only goes by the file's path, size and mtime, so never reads it;
+        see get_columns.
+        """
+        try:
+            refpath = self._ref_path(path, os.stat(path))
+            with open(refpath, 'r') as f:
+                content_hash = f.read()
+        except OSError:
+            return None
+        columns = self._load_entry(content_hash)
+        if columns is not None:
+            _touch(refpath)
+        return columns
+
+    def _load_entry(self, content_hash):
+        entrypath = self._entry_path(content_hash)
+        try:
+            with open(entrypath, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        columns = self._decode(data)
+        if columns is not None:
+            _touch(entrypath)
+        return columns
+
+    def _write(self, path, data):
+        write_atomically(path, data)
+        # Only go through the whole directory once it may be too big.
+        if self.size is not None:
+            self.size += len(data)
+        if self.size is None or self.size > self.max_bytes:
+            self.evict()
+
+    def _store_entry(self, content_hash, columns):
+        self._write(self._entry_path(content_hash), self._encode(columns))
+
+    def _store_ref(self, path, st, content_hash):
+        self._write(self._ref_path(path, st), content_hash.encode('ascii'))
+
+    def store(self, path, columns, content_hash=None):
+        """
+        Cache columns, the parse_columns() result for the file at path
+        whose content hashes to content_hash (worked out if not given).
+        """
+        st = os.stat(path)
+        if content_hash is None:
+            content_hash = hash_file_content(path)
+        self._store_entry(content_hash, columns)
+        self._store_ref(path, st, content_hash)
+
+    def get_columns(self, path):
+        """
+        Return parse_columns(path), from the cache if possible.  On a
+        miss the file is read only once, to both hash and parse it.
+        """
+        columns = self.load(path)
+        if columns is not None:
+            return columns
+
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+        content_hash = hash_content(data)
+        # The content may be cached under another name already.
+        columns = self._load_entry(content_hash)
+        if columns is None:
+            # Decoded as iter_results() decodes the file.
+            columns = parse_columns_text(data.decode('utf-8', 'replace'))
+            self._store_entry(content_hash, columns)
+        self._store_ref(path, st, content_hash)
+        return columns
+
+    def get_text_columns(self, text):
+        """
+        Return parse_columns_text(text), from the cache if possible;
+        e.g. for results that come from the results store rather than
+        a file.
+        """
+        content_hash = hash_content(text.encode('utf-8', 'surrogateescape'))
+        columns = self._load_entry(content_hash)
+        if columns is None:
+            columns = parse_columns_text(text)
+            self._store_entry(content_hash, columns)
+        return columns
+
+    def evict(self):
+        """
+        If the cache is over max_bytes, remove least recently used files
+        until it is at 90% of that.
+        """
+        files = []
+        total = 0
+        with os.scandir(self.cachedir) as it:
+            for entry in it:
+                # Leave files being written alone.
+                if entry.is_file() and not entry.name.endswith(TMP_SUFFIX):
+                    st = entry.stat()
+                    files.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        if total > self.max_bytes:
+            # Make some room, so that the next few writes don't all
+            # have to come back here.
+            target = self.max_bytes * 9 // 10
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+        self.size = total
+
+    def _encode(self, columns):
+        testnames, outcomes, lineidxs = columns
+        # Test names come from single lines, so can't contain '\n'.
+        names_blob = '\n'.join(testnames).encode('utf-8', 'surrogateescape')
+        header = self.HEADER.pack(self.MAGIC, len(testnames), len(names_blob))
+        payload = names_blob + outcomes.tobytes() + lineidxs.tobytes()
+        return header + zlib.compress(payload, 1)
+
+    def _decode(self, data):
+        hdr = self.HEADER
+        if len(data) < hdr.size:
+            return None
+        magic, count, names_len = hdr.unpack_from(data)
+        if magic != self.MAGIC:
+            return None
+        try:
+            payload = zlib.decompress(data[hdr.size:])
+        except zlib.error:
+            return None
+
+        outcomes = array('B')
+        lineidxs = array('I')
+        if len(payload) != names_len + count * (1 + lineidxs.itemsize):
+            return None
+
+        if count:
+            testnames = (payload[:names_len]
+                         .decode('utf-8', 'surrogateescape').split('\n'))
+        else:
+            testnames = []
+        outcomes.frombytes(payload[names_len:names_len + count])
+        lineidxs.frombytes(payload[names_len + count:])
+        return testnames, outcomes, lineidxs
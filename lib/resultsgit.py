@@ -0,0 +1,270 @@
+# Checkout-free writes to a git repository of test results.
+#
+# Committing results used to mean checking out the right branch of the
+# results repository first, which costs a full working-tree update per
+# build and means builds on different branches can't write at the same
+# time.  GitResultsWriter never touches a working tree (the repository
+# may be bare): it writes blobs with hash-object, rebuilds only the
+# trees on the paths that changed with ls-tree/mktree, creates the
+# commit with commit-tree and moves the branch with a compare-and-swap
+# update-ref, retrying if another writer moved it first.
+#
+# A ResultsBatch gathers everything one build publishes into a single
+# such commit.
+
+import os
+import random
+import subprocess
+import time
+
+EMPTY_OID = '0' * 40
+
+
+class GitError(Exception):
+    pass
+
+
+class GitResultsWriter:
+    """
+    Writes files to branches of the git repository at repodir.
+    """
+    # Attempts at moving a branch that other writers keep moving.
+    RETRIES = 20
+
+    def __init__(self, repodir, author_name='GCC BuildBot',
+                 author_email='buildbot@localhost'):
+        self.repodir = repodir
+        self.env = dict(os.environ,
+                        GIT_AUTHOR_NAME=author_name,
+                        GIT_AUTHOR_EMAIL=author_email,
+                        GIT_COMMITTER_NAME=author_name,
+                        GIT_COMMITTER_EMAIL=author_email)
+
+    @classmethod
+    def init_bare(cls, repodir, **kwargs):
+        """
+        Return a writer for the bare repository at repodir, creating it
+        if needed.
+        """
+        if not os.path.exists(os.path.join(repodir, 'HEAD')):
+            subprocess.check_call(['git', 'init', '--quiet', '--bare', repodir])
+        return cls(repodir, **kwargs)
+
+    def git(self, *args, input=None):
+        proc = subprocess.run(('git',) + args, cwd=self.repodir, env=self.env,
+                              input=input, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise GitError('git {} failed: {}'.format(
+                ' '.join(args), proc.stderr.decode('utf-8', 'replace').strip()))
+        return proc.stdout
+
+    def resolve(self, branch):
+        """
+        Return the commit branch points at, or None if it doesn't exist.
+        """
+        try:
+            out = self.git('rev-parse', '--verify', '--quiet',
+                           'refs/heads/{}^{{commit}}'.format(branch))
+        except GitError:
+            return None
+        return out.decode('ascii').strip()
+
+    def read(self, branch, path):
+        """
+        Return the contents of path on branch, or None.
+        """
+        try:
+            return self.git('cat-file', 'blob', '{}:{}'.format(branch, path))
+        except GitError:
+            return None
+
+    def write_blob(self, data):
+        return self.git('hash-object', '-w', '--stdin',
+                        input=data).decode('ascii').strip()
+
+    def _read_tree(self, treeish):
+        """
+        Return {name: (mode, type, oid)} for the tree treeish, or {}.
+        """
+        if treeish is None:
+            return {}
+        try:
+            out = self.git('ls-tree', '-z', treeish)
+        except GitError:
+            return {}
+        entries = {}
+        for record in out.split(b'\0'):
+            if record:
+                info, name = record.split(b'\t', 1)
+                mode, objtype, oid = info.decode('ascii').split(' ')
+                entries[name] = (mode, objtype, oid)
+        return entries
+
+    def _write_tree(self, entries):
+        data = b''.join(
+            '{} {} {}\t'.format(mode, objtype, oid).encode('ascii') + name + b'\0'
+            for name, (mode, objtype, oid) in sorted(entries.items()))
+        return self.git('mktree', '-z', input=data).decode('ascii').strip()
+
+    def _update_tree(self, treeish, changes):
+        """
+        Return the oid of tree treeish with changes applied.  changes
+        maps a path, split into bytes components, to a blob oid or to
+        None to delete it.  Only the trees on changed paths are read and
+        rewritten.  Returns None if the resulting tree is empty.
+        """
+        entries = self._read_tree(treeish)
+        subdirs = {}
+        for components, oid in changes.items():
+            name = components[0]
+            if len(components) == 1:
+                if oid is None:
+                    entries.pop(name, None)
+                else:
+                    entries[name] = ('100644', 'blob', oid)
+            else:
+                subdirs.setdefault(name, {})[components[1:]] = oid
+
+        for name, subchanges in subdirs.items():
+            current = entries.get(name)
+            subtree = current[2] if current and current[1] == 'tree' else None
+            oid = self._update_tree(subtree, subchanges)
+            if oid is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = ('040000', 'tree', oid)
+
+        if not entries:
+            return None
+        return self._write_tree(entries)
+
+    def _lookup(self, commit, path):
+        """
+        Return the oid of the blob at path in commit, or None.
+        """
+        if commit is None:
+            return None
+        try:
+            out = self.git('rev-parse', '--verify', '--quiet',
+                           '{}:{}'.format(commit, path))
+        except GitError:
+            return None
+        return out.decode('ascii').strip()
+
+    def commit(self, branch, files, message):
+        """
+        Commit files, a dict from path to contents (bytes), or to None to
+        delete the path, on top of branch, creating the branch if need
+        be.  Returns the new commit's oid, or the current one if nothing
+        changed.
+        """
+        ops = [('write', path, None if data is None else self.write_blob(data))
+               for path, data in files.items()]
+        return self.commit_ops(branch, ops, message)
+
+    def commit_ops(self, branch, ops, message):
+        """
+        Like commit, but for a sequence of ('write', path, blob oid or
+        None) and ('copy', src, dst) operations, applied in order.  A
+        copy sees the earlier operations, or else the branch as it is
+        when the commit is made, and does nothing if there is no src.
+        """
+        for attempt in range(self.RETRIES):
+            if attempt:
+                time.sleep(random.uniform(0, 0.01 * attempt))
+            parent = self.resolve(branch)
+
+            # Work out the final oid of every path touched:
+            state = {}
+            for op, a, b in ops:
+                if op == 'write':
+                    state[a] = b
+                elif a in state:
+                    state[b] = state[a]
+                else:
+                    oid = self._lookup(parent, a)
+                    if oid is not None:
+                        state[b] = oid
+            changes = {}
+            for path, oid in state.items():
+                components = tuple(c.encode('utf-8')
+                                   for c in path.split('/') if c)
+                changes[components] = oid
+
+            parent_tree = '{}^{{tree}}'.format(parent) if parent else None
+            tree = self._update_tree(parent_tree, changes)
+            if tree is None:
+                tree = self._write_tree({})
+            if parent is not None and tree == self.git(
+                    'rev-parse', parent_tree).decode('ascii').strip():
+                return parent
+
+            args = ['commit-tree', tree, '-m', message]
+            if parent is not None:
+                args += ['-p', parent]
+            new = self.git(*args).decode('ascii').strip()
+            try:
+                self.git('update-ref', '-m', message,
+                         'refs/heads/{}'.format(branch), new,
+                         parent if parent is not None else EMPTY_OID)
+            except GitError:
+                # Someone else moved the branch; redo on top of theirs.
+                continue
+            return new
+
+        raise GitError('could not update branch {} after {} attempts'
+                       .format(branch, self.RETRIES))
+
+
+class ResultsBatch:
+    """
+    Everything one build publishes (sums, logs, baseline promotion,
+    xfail metadata...), gathered and then committed to branch as a
+    single commit, so that readers never see half of a build's results.
+
+    Contents are written to the object database as they are added, but
+    nothing is visible until commit().  Used as a context manager, the
+    batch commits on success and is discarded if an exception escapes.
+    """
+    def __init__(self, writer, branch, message):
+        self.writer = writer
+        self.branch = branch
+        self.message = message
+        self.ops = []
+        self.committed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
+
+    def add(self, path, data):
+        """
+        Add (or replace) path with data, bytes or str.
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.ops.append(('write', path, self.writer.write_blob(data)))
+
+    def add_file(self, path, filename):
+        with open(filename, 'rb') as f:
+            self.add(path, f.read())
+
+    def delete(self, path):
+        self.ops.append(('write', path, None))
+
+    def promote(self, src, dst):
+        """
+        Make dst the same as src, as of this point in the batch (e.g.
+        the current sum becomes the previous one, or the baseline).
+        """
+        self.ops.append(('copy', src, dst))
+
+    def commit(self):
+        if self.committed is None:
+            self.committed = self.writer.commit_ops(self.branch, self.ops,
+                                                    self.message)
+        return self.committed
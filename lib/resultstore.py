@@ -0,0 +1,161 @@
+# Content-addressed store of test results (.sum texts).
+#
+# Every builder and branch keeps a few named results: the latest
+# gcc.sum, the previous_gcc.sum, the baseline and the latest try-build
+# sum.  Rather than full copies of each, the store keeps every distinct
+# content once, compressed, and the names are small ref files holding
+# the content's hash:
+#
+#   <root>/objects/<2 hex digits>/<rest of the sha256>
+#   <root>/refs/<builder>/<quoted branch>/<name>
+#
+# Writes of objects and refs are atomic (write to a temporary file, then
+# rename), so readers never see a partial result, and promoting one
+# name to another (e.g. gcc.sum to baseline) just rewrites a ref.
+# update_refs() changes several refs of a builder and branch together.
+
+import hashlib
+import json
+import os
+import zlib
+from urllib.parse import quote
+
+from atomicfile import write_atomically
+
+# Ref names used by the GCC steps.
+SUM = 'gcc.sum'
+PREVIOUS_SUM = 'previous_gcc.sum'
+BASELINE = 'baseline'
+TRY_SUM = 'try_gcc.sum'
+
+
+class ResultsStore:
+    """
+    Deduplicated, zlib-compressed store of results under root.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def ref_path(self, builder, branch, name):
+        """
+        Return the file holding the ref name.  It is replaced whenever
+        the ref changes, so its stat tells when to re-read the results.
+        """
+        return os.path.join(self._refs_dir(builder, branch), name)
+
+    def _refs_dir(self, builder, branch):
+        return os.path.join(self.root, 'refs', quote(builder, safe=''),
+                            quote(branch, safe=''))
+
+    def put(self, data):
+        """
+        Store data (bytes) if it isn't already there; return its hash.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            write_atomically(path, zlib.compress(data), fsync=True,
+                             makedirs=True)
+        return digest
+
+    def get(self, digest):
+        with open(self._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def _update_path(self, builder, branch):
+        # Not a ref name used by anything, so it can't clash with one.
+        return os.path.join(self._refs_dir(builder, branch), '.update')
+
+    def _apply(self, builder, branch, refs):
+        for name, digest in refs.items():
+            path = self.ref_path(builder, branch, name)
+            if digest is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            else:
+                write_atomically(path, digest.encode('ascii'), fsync=True,
+                                 makedirs=True)
+
+    def _finish_update(self, builder, branch):
+        """
+        Finish an update_refs() that was cut short, if there is one.
+        """
+        path = self._update_path(builder, branch)
+        try:
+            with open(path, 'rb') as f:
+                refs = json.loads(f.read().decode('ascii'))
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # The update never got as far as changing any ref.
+            os.remove(path)
+            return
+        self._apply(builder, branch, refs)
+        os.remove(path)
+
+    def get_ref(self, builder, branch, name):
+        """
+        Return the hash that name points to, or None.
+        """
+        self._finish_update(builder, branch)
+        try:
+            with open(self.ref_path(builder, branch, name), 'r') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_ref(self, builder, branch, name, digest):
+        self.update_refs(builder, branch, {name: digest})
+
+    def delete_ref(self, builder, branch, name):
+        self.update_refs(builder, branch, {name: None})
+
+    def update_refs(self, builder, branch, refs):
+        """
+        Point each name in refs at its hash, or delete it if its hash
+        is None, all at once: the new refs are first written to an
+        update file, so that if the update is cut short, the next use
+        of these refs finishes it.
+        """
+        self._finish_update(builder, branch)
+        if len(refs) > 1:
+            path = self._update_path(builder, branch)
+            write_atomically(path, json.dumps(refs).encode('ascii'),
+                             fsync=True, makedirs=True)
+            self._apply(builder, branch, refs)
+            os.remove(path)
+        else:
+            self._apply(builder, branch, refs)
+
+    def read(self, builder, branch, name):
+        """
+        Return the text stored under name, or None.
+        """
+        digest = self.get_ref(builder, branch, name)
+        if digest is None:
+            return None
+        return self.get(digest).decode('utf-8', 'replace')
+
+    def write(self, builder, branch, name, text):
+        """
+        Store text under name, returning its hash.
+        """
+        digest = self.put(text.encode('utf-8'))
+        self.set_ref(builder, branch, name, digest)
+        return digest
+
+    def promote(self, builder, branch, src, dst):
+        """
+        Make dst point at the same results as src.  Returns False, and
+        leaves dst alone, if there is no src.
+        """
+        digest = self.get_ref(builder, branch, src)
+        if digest is None:
+            return False
+        self.set_ref(builder, branch, dst, digest)
+        return True
@@ -0,0 +1,221 @@
+# Cross-build history of test outcomes.
+#
+# A HistoryStore answers questions like "how has this test behaved over
+# the last 500 builds?" without re-parsing 500 archived .sum files.
+# Feed it the dejagnu.TestRun of every build with record(), then query
+# a test's timeline(), flip_count() or first_failing() build.
+#
+# The store is a directory of three append-only files:
+#
+#   names.txt    The shared test dictionary: one key per line, where
+#                a key is "<.sum path relative to the run>\t<test name>"
+#                and the line index is the test's ID.
+#   columns.dat  One column per build, of one byte per test ID known
+#                when the build was recorded: 0 if the test didn't run,
+#                otherwise 1 + its dejagnu.OUTCOME_CODES code.
+#   builds.txt   One "<offset> <length> <label>" line per build, giving
+#                where its column lives in columns.dat.  A build only
+#                exists once this line is written, so a crash part-way
+#                through record() leaves no half-recorded build.
+#
+# columns.dat is memory-mapped, so a query reads one byte per build for
+# the test it asks about, whatever the number of tests or builds.
+
+import mmap
+import os
+
+from dejagnu import BAD_OUTCOMES, OUTCOMES, OUTCOME_CODES, final_outcomes
+
+_BAD_COLUMN_CODES = frozenset(OUTCOME_CODES[outcome] + 1
+                              for outcome in BAD_OUTCOMES)
+
+
+def make_key(relpath, testname):
+    return '{}\t{}'.format(relpath, testname)
+
+
+def _truncate_torn_line(path):
+    """
+    Drop a partial last line, left by a crash mid-append, from the
+    file at path, so that the next append starts on a line of its own.
+    """
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return
+    with f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+class HistoryStore:
+    """
+    Append-only, memory-mapped store of per-build test outcomes in
+    directory path.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.names_path = os.path.join(path, 'names.txt')
+        self.columns_path = os.path.join(path, 'columns.dat')
+        self.builds_path = os.path.join(path, 'builds.txt')
+
+        _truncate_torn_line(self.names_path)
+        _truncate_torn_line(self.builds_path)
+
+        self.key_to_id = {}
+        if os.path.exists(self.names_path):
+            with open(self.names_path, encoding='utf-8',
+                      errors='surrogateescape') as f:
+                for testid, line in enumerate(f):
+                    self.key_to_id[line.rstrip('\n')] = testid
+
+        # (label, offset, length) for every build, oldest first.
+        self.builds = []
+        if os.path.exists(self.builds_path):
+            with open(self.builds_path, encoding='utf-8') as f:
+                for line in f:
+                    offset, length, label = line.rstrip('\n').split(' ', 2)
+                    self.builds.append((label, int(offset), int(length)))
+
+        self._columns = None
+
+    def __len__(self):
+        return len(self.builds)
+
+    def labels(self):
+        return [label for label, _, _ in self.builds]
+
+    def _map_columns(self):
+        """
+        Return columns.dat memory-mapped, remapping it if it has grown.
+        """
+        if not self.builds:
+            return None
+        label, offset, length = self.builds[-1]
+        if self._columns is None or len(self._columns) < offset + length:
+            if self._columns is not None:
+                self._columns.close()
+            with open(self.columns_path, 'rb') as f:
+                self._columns = mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)
+        return self._columns
+
+    def record(self, label, run):
+        """
+        Append the results of run, a dejagnu.TestRun, as build label
+        (e.g. the build number or the revision tested).
+        """
+        if '\n' in label:
+            raise ValueError('build label must be a single line')
+
+        new_keys = []
+        values = []
+        key_to_id = self.key_to_id
+        for relpath, sumfile in sorted(run.make_dict_by_rel_path().items()):
+            names = sumfile.names.names
+            for nameid, code in final_outcomes(sumfile).items():
+                key = make_key(relpath, names[nameid])
+                testid = key_to_id.get(key)
+                if testid is None:
+                    testid = key_to_id[key] = len(key_to_id)
+                    new_keys.append(key)
+                values.append((testid, code + 1))
+
+        column = bytearray(len(key_to_id))
+        for testid, value in values:
+            column[testid] = value
+
+        self._append(label, column, new_keys)
+
+    def _append(self, label, column, new_keys):
+        # Write the column, then any new names, then (last) the build
+        # line that makes them part of the history.  If any of that
+        # fails, cut names.txt and builds.txt back to where they were
+        # and forget the new IDs, so that the IDs in memory and on disk
+        # can't drift apart.
+        sizes = {}
+        for path in (self.names_path, self.builds_path):
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                sizes[path] = 0
+        try:
+            self._write(label, column, new_keys)
+        except BaseException:
+            for path, size in sizes.items():
+                with open(path, 'ab') as f:
+                    f.truncate(size)
+            for key in new_keys:
+                del self.key_to_id[key]
+            raise
+
+    def _write(self, label, column, new_keys):
+        with open(self.columns_path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(column)
+            f.flush()
+            os.fsync(f.fileno())
+        if new_keys:
+            with open(self.names_path, 'a', encoding='utf-8',
+                      errors='surrogateescape') as f:
+                f.write(''.join(key + '\n' for key in new_keys))
+                f.flush()
+                os.fsync(f.fileno())
+        with open(self.builds_path, 'a', encoding='utf-8') as f:
+            f.write('{} {} {}\n'.format(offset, len(column), label))
+            f.flush()
+            os.fsync(f.fileno())
+        self.builds.append((label, offset, len(column)))
+
+    def _values(self, relpath, testname):
+        """
+        Generate (label, column value) for the test in every build.
+        """
+        testid = self.key_to_id.get(make_key(relpath, testname))
+        columns = self._map_columns()
+        for label, offset, length in self.builds:
+            if testid is None or testid >= length:
+                yield label, 0
+            else:
+                yield label, columns[offset + testid]
+
+    def timeline(self, relpath, testname):
+        """
+        Return [(label, outcome)] for the test in every build, oldest
+        first; outcome is None for builds in which the test didn't run.
+        """
+        return [(label, OUTCOMES[value - 1] if value else None)
+                for label, value in self._values(relpath, testname)]
+
+    def flip_count(self, relpath, testname):
+        """
+        Return how many times the test changed outcome between the
+        builds in which it ran.
+        """
+        flips = 0
+        previous = 0
+        for _, value in self._values(relpath, testname):
+            if value:
+                if previous and value != previous:
+                    flips += 1
+                previous = value
+        return flips
+
+    def first_failing(self, relpath, testname):
+        """
+        Return the label of the build in which the test started its
+        current run of bad outcomes, or None if it isn't failing in the
+        latest build it ran in.
+        """
+        first = None
+        for label, value in self._values(relpath, testname):
+            if not value:
+                continue
+            if value in _BAD_COLUMN_CODES:
+                if first is None:
+                    first = label
+            else:
+                first = None
+        return first
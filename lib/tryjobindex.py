@@ -0,0 +1,118 @@
+# Index from names to email addresses, built from try job files.
+#
+# Try jobs sent over ssh are kept in a maildir-like job directory (new/
+# and cur/), and the "Name <address>," of whoever sent a job appears in
+# its file, as a netstring.  Instead of reading every job file on every
+# lookup, the index remembers which files (by path and mtime) it has
+# already read, and only reads the ones it hasn't; it skips even listing
+# a directory whose mtime hasn't changed (job files are written once and
+# renamed into place, so a new job always changes its directory's
+# mtime).  Lookups are then a dict access.  The index is saved as JSON
+# next to the job directories, so a restarted master doesn't need to
+# read them all again.
+#
+# When a name appears in several jobs, a job in new/ wins over one in
+# cur/, then the newest job, then the last line of that job.
+
+import json
+import os
+import re
+
+from atomicfile import write_atomically
+
+# "Name <address>,", possibly after a netstring length ("19:").
+_ADDRESS_RE = re.compile(r'(?:\d+:)?([^,:<>]+?) <([^<>\s]+@[^<>\s]+)>,')
+
+
+class TryJobAddressIndex:
+    """
+    Name -> "Name <address>" index of the try job files under jobdir.
+    """
+    # Subdirectories to read, the later ones taking precedence.
+    SUBDIRS = ['cur', 'new']
+
+    def __init__(self, jobdir, indexpath=None):
+        self.jobdir = jobdir
+        self.indexpath = indexpath or os.path.join(jobdir, 'address-index.json')
+        self.dir_mtimes = {}
+        # path -> mtime_ns of the job files read.
+        self.files = {}
+        # name -> [subdir rank, mtime_ns, address]
+        self.names = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.indexpath) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.dir_mtimes = data.get('dir_mtimes', {})
+        self.files = data.get('files', {})
+        self.names = data.get('names', {})
+
+    def _save(self):
+        write_atomically(self.indexpath, json.dumps(
+            {'dir_mtimes': self.dir_mtimes,
+             'files': self.files,
+             'names': self.names}))
+
+    def _read_job(self, path, rank, mtime):
+        try:
+            with open(path, 'r', errors='replace') as f:
+                for line in f:
+                    for m in _ADDRESS_RE.finditer(line):
+                        name = m.group(1).strip()
+                        entry = [rank, mtime, '{} <{}>'.format(name, m.group(2))]
+                        current = self.names.get(name)
+                        if current is None or current[:2] <= entry[:2]:
+                            self.names[name] = entry
+        except OSError:
+            pass
+
+    def update(self):
+        """
+        Read the job files not seen before.  Returns True if the index
+        changed.
+        """
+        changed = False
+        for rank, subdir in enumerate(self.SUBDIRS):
+            directory = os.path.join(self.jobdir, subdir)
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            if self.dir_mtimes.get(subdir) == dir_mtime:
+                continue
+            present = set()
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    present.add(entry.path)
+                    mtime = entry.stat().st_mtime_ns
+                    if self.files.get(entry.path) == mtime:
+                        continue
+                    self._read_job(entry.path, rank, mtime)
+                    self.files[entry.path] = mtime
+            # Forget files that have gone (e.g. moved from new/ to cur/),
+            # but keep the addresses learnt from them.
+            prefix = directory + os.sep
+            for path in [p for p in self.files
+                         if p.startswith(prefix) and p not in present]:
+                del self.files[path]
+            self.dir_mtimes[subdir] = dir_mtime
+            changed = True
+        if changed:
+            try:
+                self._save()
+            except OSError:
+                pass
+        return changed
+
+    def lookup(self, name):
+        """
+        Return "Name <address>" for name, or None.
+        """
+        entry = self.names.get(name)
+        return entry[2] if entry is not None else None
@@ -0,0 +1,10 @@
+# Unit tests for the modules in lib/, which import each other as
+# top-level modules, as master.cfg has them.  Run them with:
+#
+#   python -m unittest discover -s tests -t .
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'lib'))
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from atomicfile import atomic_file, write_atomically
+
+
+class AtomicFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'file')
+
+    def test_write(self):
+        write_atomically(self.path, b'bytes')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'bytes')
+        write_atomically(self.path, 'text', fsync=True)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'text')
+        self.assertEqual(os.listdir(self.tmpdir), ['file'])
+
+    def test_makedirs(self):
+        path = os.path.join(self.tmpdir, 'a', 'b', 'file')
+        self.assertRaises(OSError, write_atomically, path, b'x')
+        write_atomically(path, b'x', makedirs=True)
+        self.assertTrue(os.path.exists(path))
+
+    def test_error_leaves_file_alone(self):
+        write_atomically(self.path, b'old')
+        with self.assertRaises(RuntimeError):
+            with atomic_file(self.path) as f:
+                f.write(b'new')
+                raise RuntimeError
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+        self.assertEqual(os.listdir(self.tmpdir), ['file'])
+
+    def test_concurrent_writers_use_own_temporary_files(self):
+        with atomic_file(self.path) as a:
+            with atomic_file(self.path) as b:
+                self.assertEqual(len([name for name in os.listdir(self.tmpdir)
+                                      if name.endswith('.tmp')]), 2)
+                b.write(b'b')
+            a.write(b'a')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'a')
+
+
+if __name__ == '__main__':
+    unittest.main()
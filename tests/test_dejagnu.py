@@ -0,0 +1,301 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+import dejagnu
+from dejagnu import (OUTCOMES, OUTCOME_CODES, DejaFile, JSONLinesReporter,
+                     JUnitReporter, NameTable, ResultStream, SumFile,
+                     TestRun, TextReporter, iter_result_lines,
+                     parse_columns_text)
+
+SUM_TEXT = """\
+Test Run By buildbot on Sun Oct 18 00:00:00 2026
+Native configuration is riscv32-unknown-elf
+
+\t\t=== gcc tests ===
+
+Running /src/gcc/testsuite/gcc.dg/dg.exp ...
+PASS: gcc.dg/pr1.c (test for excess errors)
+FAIL: gcc.dg/pr2.c execution test
+XFAIL: gcc.dg/pr3.c (test for warnings, line 4)
+NOTE: this is not a result
+UNSUPPORTED: gcc.dg/pr4.c
+FAIL: gcc.dg/pr1.c (test for excess errors)   
+
+\t\t=== gcc Summary ===
+
+# of expected passes\t\t1
+"""
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, relpath, text):
+        path = os.path.join(self.tmpdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+
+class ParserTest(TempDirTestCase):
+    def test_iter_result_lines(self):
+        results = list(iter_result_lines(SUM_TEXT.splitlines(True)))
+        self.assertEqual(results, [
+            ('PASS', 'gcc.dg/pr1.c (test for excess errors)', 7),
+            ('FAIL', 'gcc.dg/pr2.c execution test', 8),
+            ('XFAIL', 'gcc.dg/pr3.c (test for warnings, line 4)', 9),
+            ('UNSUPPORTED', 'gcc.dg/pr4.c', 11),
+            ('FAIL', 'gcc.dg/pr1.c (test for excess errors)', 12)])
+
+    def test_separator_must_follow_outcome(self):
+        lines = ['This PASS: is prose\n', 'PASSED: no\n', 'PASS:no space\n']
+        self.assertEqual(list(iter_result_lines(lines)), [])
+
+    def test_parse_columns_text(self):
+        testnames, outcomes, lineidxs = parse_columns_text(SUM_TEXT)
+        self.assertEqual(len(testnames), 5)
+        self.assertEqual([OUTCOMES[c] for c in outcomes],
+                         ['PASS', 'FAIL', 'XFAIL', 'UNSUPPORTED', 'FAIL'])
+        self.assertEqual(list(lineidxs), [6, 7, 8, 10, 11])
+
+    def test_parse_columns_text_crlf(self):
+        self.assertEqual(parse_columns_text(SUM_TEXT.replace('\n', '\r\n')),
+                         parse_columns_text(SUM_TEXT))
+
+    def test_parse_columns_matches_file(self):
+        path = self.write('gcc.sum', SUM_TEXT)
+        self.assertEqual(dejagnu.parse_columns(path),
+                         parse_columns_text(SUM_TEXT))
+
+    def test_result_stream_across_chunks(self):
+        stream = ResultStream()
+        results = []
+        for i in range(0, len(SUM_TEXT), 7):
+            results += stream.feed(SUM_TEXT[i:i + 7])
+        results += stream.finish()
+        self.assertEqual(results,
+                         list(iter_result_lines(SUM_TEXT.splitlines(True))))
+        self.assertEqual(stream.counts['FAIL'], 2)
+        self.assertEqual(stream.counts['PASS'], 1)
+
+    def test_result_stream_unterminated_last_line(self):
+        stream = ResultStream()
+        self.assertEqual(stream.feed('PASS: a\nFAIL: b'), [('PASS', 'a', 1)])
+        self.assertEqual(stream.finish(), [('FAIL', 'b', 2)])
+        self.assertEqual(stream.finish(), [])
+
+
+class DejaFileTest(TempDirTestCase):
+    def test_columns(self):
+        sumfile = SumFile(self.write('gcc.sum', SUM_TEXT))
+        names = sumfile.names.names
+        self.assertEqual([names[i] for i in sumfile.nameids],
+                         [testname for testname, _, _ in
+                          sumfile.iter_entries()])
+        # pr1.c appears twice, but is interned once.
+        self.assertEqual(len(sumfile.names), 4)
+        self.assertEqual(sumfile.outcomes[0], OUTCOME_CODES['PASS'])
+
+    def test_last_result_wins(self):
+        sumfile = SumFile(self.write('gcc.sum', SUM_TEXT))
+        self.assertEqual(
+            sumfile.testname_to_outcome['gcc.dg/pr1.c (test for excess errors)'],
+            'FAIL')
+        self.assertEqual(
+            sumfile.testname_to_lineidx['gcc.dg/pr1.c (test for excess errors)'],
+            11)
+        self.assertEqual(sumfile.outcome_to_testnames['FAIL'],
+                         {'gcc.dg/pr1.c (test for excess errors)',
+                          'gcc.dg/pr2.c execution test'})
+
+    def test_shared_name_table(self):
+        names = NameTable()
+        a = SumFile(self.write('a/gcc.sum', SUM_TEXT), names)
+        b = SumFile(self.write('b/gcc.sum', SUM_TEXT), names)
+        self.assertEqual(len(names), 4)
+        self.assertEqual(list(a.nameids), list(b.nameids))
+
+    def test_lazy_file_parsed_on_demand(self):
+        sumfile = SumFile(self.write('gcc.sum', SUM_TEXT), lazy=True)
+        self.assertEqual(len(sumfile.nameids), 0)
+        self.assertEqual(len(sumfile.testname_to_outcome), 4)
+
+    def test_find_parses_lazy_file(self):
+        sumfile = DejaFile(self.write('gcc.sum', SUM_TEXT), lazy=True)
+        sumfile.print_match = lambda *args: None
+        self.assertEqual(sumfile.find('gcc.dg/pr2.c execution test'), 1)
+        self.assertEqual(sumfile.find('gcc.dg/nonexistent.c'), 0)
+
+
+class TestRunTest(TempDirTestCase):
+    def test_directory(self):
+        self.write('gcc/gcc.sum', SUM_TEXT)
+        self.write('g++/g++.sum', 'PASS: x\n')
+        self.write('gcc/gcc.log', SUM_TEXT)
+        run = TestRun(self.tmpdir, jobs=1)
+        self.assertEqual(sorted(run.make_dict_by_rel_path()),
+                         ['g++/g++.sum', 'gcc/gcc.sum'])
+
+    def test_from_sum_texts(self):
+        run = TestRun.from_sum_texts({'gcc/gcc.sum': SUM_TEXT,
+                                      'g++/g++.sum': 'PASS: x\n'})
+        by_path = run.make_dict_by_rel_path()
+        self.assertEqual(sorted(by_path), ['g++/g++.sum', 'gcc/gcc.sum'])
+        self.assertEqual(by_path['g++/g++.sum'].testname_to_outcome,
+                         {'x': 'PASS'})
+
+
+class DiffTest(TempDirTestCase):
+    BEFORE = ('PASS: same\n'
+              'PASS: regressed\n'
+              'FAIL: fixed\n'
+              'FAIL: still failing\n'
+              'PASS: went away\n'
+              'XFAIL: xfail to pass\n')
+    AFTER = ('PASS: same\n'
+             'FAIL: regressed\n'
+             'PASS: fixed\n'
+             'FAIL: still failing\n'
+             'FAIL: new failure\n'
+             'PASS: new pass\n'
+             'XPASS: xfail to pass\n')
+
+    def runs(self, before, after, names=None):
+        return (TestRun.from_sum_texts({'gcc.sum': before}, names),
+                TestRun.from_sum_texts({'gcc.sum': after}, names))
+
+    def check_diff(self, diff):
+        self.assertEqual(diff.disappeared, [('went away', 'PASS')])
+        self.assertEqual(diff.appeared, [('new failure', 'FAIL'),
+                                         ('new pass', 'PASS')])
+        self.assertEqual(diff.changed, [('fixed', 'FAIL', 'PASS'),
+                                        ('regressed', 'PASS', 'FAIL'),
+                                        ('xfail to pass', 'XFAIL', 'XPASS')])
+        self.assertEqual(diff.new_failures, [('new failure', 'FAIL'),
+                                             ('regressed', 'FAIL'),
+                                             ('xfail to pass', 'XPASS')])
+        self.assertEqual(diff.fixed, [('fixed', 'PASS')])
+        self.assertEqual(diff.issue_count, 6)
+
+    def test_shared_names(self):
+        before, after = self.runs(self.BEFORE, self.AFTER, NameTable())
+        diff = before.compare(after)
+        self.assertEqual(len(diff.files), 1)
+        self.check_diff(diff.files[0])
+
+    def test_separate_names(self):
+        before, after = self.runs(self.BEFORE, self.AFTER)
+        self.check_diff(before.compare(after).files[0])
+
+    def test_identical(self):
+        for names in (NameTable(), None):
+            before, after = self.runs(self.BEFORE, self.BEFORE, names)
+            diff = before.compare(after)
+            self.assertFalse(diff.files[0])
+            self.assertEqual(diff.issue_count, 0)
+
+    def test_last_result_counts(self):
+        before, after = self.runs('FAIL: t\nPASS: t\n', 'PASS: t\n')
+        self.assertEqual(before.compare(after).issue_count, 0)
+
+    def test_sum_files_come_and_go(self):
+        before = TestRun.from_sum_texts({'a.sum': 'PASS: a\n',
+                                         'b.sum': 'PASS: b\n'})
+        after = TestRun.from_sum_texts({'b.sum': 'FAIL: b\n',
+                                        'c.sum': 'PASS: c\n'})
+        diff = before.compare(after)
+        self.assertEqual(list(diff.missing_sumfiles), ['a.sum'])
+        self.assertEqual(list(diff.new_sumfiles), ['c.sum'])
+        self.assertEqual(diff.new_failures, {'b.sum': [('b', 'FAIL')]})
+        self.assertEqual(diff.fixed, {})
+        self.assertEqual(diff.issue_count, 3)
+
+    def test_directories(self):
+        self.write('before/gcc/gcc.sum', self.BEFORE)
+        self.write('after/gcc/gcc.sum', self.AFTER)
+        names = NameTable()
+        before = TestRun(os.path.join(self.tmpdir, 'before'), names, jobs=1)
+        after = TestRun(os.path.join(self.tmpdir, 'after'), names, jobs=1)
+        diff = before.compare(after)
+        self.assertEqual([d.relpath for d in diff.files], ['gcc/gcc.sum'])
+        self.check_diff(diff.files[0])
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        io.StringIO.__init__(self)
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return io.StringIO.write(self, text)
+
+
+class ReporterTest(unittest.TestCase):
+    def dump(self, reporter_class, texts):
+        stream = CountingStream()
+        with reporter_class(stream) as tr:
+            TestRun.from_sum_texts(texts).dump(tr)
+        return stream
+
+    def test_text(self):
+        stream = self.dump(TextReporter, {'gcc.sum': 'PASS: a\nFAIL: b\n'})
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0], 'gcc.sum')
+        self.assertIn(' FAIL: 1 tests', lines)
+        self.assertIn('  b', lines)
+
+    def test_text_buffers_sections(self):
+        text = ''.join('PASS: t{}\n'.format(i) for i in range(100))
+        stream = self.dump(TextReporter, {'gcc.sum': text})
+        # Written in a few batches, not a write per line.
+        self.assertLess(stream.writes, 10)
+        self.assertEqual(len([line for line in stream.getvalue().splitlines()
+                              if line.startswith('  t')]), 100)
+
+    def test_json_lines(self):
+        stream = self.dump(JSONLinesReporter,
+                           {'gcc.sum': 'PASS: a\nFAIL: caf\xe9\n'})
+        records = [json.loads(line)
+                   for line in stream.getvalue().splitlines()]
+        self.assertIn({'file': 'gcc.sum', 'outcome': 'FAIL',
+                       'test': 'caf\xe9'}, records)
+        self.assertIn({'file': 'gcc.sum', 'outcome': 'PASS', 'test': 'a'},
+                      records)
+
+    def test_junit(self):
+        stream = self.dump(JUnitReporter,
+                           {'a.sum': 'PASS: d/a.c\nFAIL: d/b.c <&>\n',
+                            'b.sum': 'XFAIL: c \x01\n'})
+        root = ET.fromstring(stream.getvalue())
+        suites = root.findall('testsuite')
+        self.assertEqual([suite.get('name') for suite in suites],
+                         ['a.sum', 'b.sum'])
+        cases = {case.get('name'): case for case in root.iter('testcase')}
+        self.assertEqual(cases['d/a.c'].get('classname'), 'd')
+        self.assertIsNotNone(cases['d/b.c <&>'].find('failure'))
+        self.assertIsNotNone(cases['c ?'].find('skipped'))
+
+    def test_junit_empty(self):
+        stream = self.dump(JUnitReporter, {})
+        self.assertEqual(ET.fromstring(stream.getvalue()).tag, 'testsuites')
+
+    def test_report_diff(self):
+        before = TestRun.from_sum_texts({'gcc.sum': 'PASS: a\n'})
+        after = TestRun.from_sum_texts({'gcc.sum': 'FAIL: a\n'})
+        stream = io.StringIO()
+        with TextReporter(stream) as tr:
+            self.assertEqual(before.compare(after).report(tr), 1)
+        self.assertIn('PASS -> FAIL : a', stream.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
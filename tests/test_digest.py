@@ -0,0 +1,107 @@
+import email
+import os
+import shutil
+import tempfile
+import unittest
+
+from twisted.internet.task import Clock
+
+from digest import DigestNotifier
+
+
+class DigestNotifierTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.statepath = os.path.join(self.tmpdir, 'digest.json')
+        self.clock = Clock()
+        self.sent = []
+
+    def notifier(self, **kwargs):
+        def send(sender, recipients, message):
+            self.sent.append(email.message_from_string(message))
+        kwargs.setdefault('statepath', self.statepath)
+        return DigestNotifier(send, 'buildbot@example.com',
+                              ['gcc-testers@example.com'], window=600,
+                              clock=self.clock, **kwargs)
+
+    def add(self, digest, builder, result, revision='abc', branch='master'):
+        digest.add(revision, branch, 'Jane Doe',
+                   'Fix the thing\n\nLonger text.', builder, result,
+                   subject='Failures on {}'.format(builder),
+                   body='details for {}\n'.format(builder))
+
+    def test_one_message_after_window(self):
+        digest = self.notifier()
+        self.add(digest, 'B1', 'failure')
+        self.clock.advance(300)
+        self.add(digest, 'B2', 'success')
+        self.assertEqual(self.sent, [])
+        self.clock.advance(300)
+        self.assertEqual(len(self.sent), 1)
+        mail = self.sent[0]
+        self.assertEqual(mail['Subject'],
+                         '[gcc] Fix the thing (1 of 2 builders failed)')
+        body = mail.get_payload()
+        self.assertIn('1 of 2 builder(s) failed: B1', body)
+        self.assertIn('details for B2', body)
+
+    def test_sent_when_expected_builders_reported(self):
+        digest = self.notifier(expected_builders=['B1', 'B2'])
+        self.add(digest, 'B1', 'success', branch='gcc-9')
+        self.add(digest, 'B2', 'success', branch='gcc-9')
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0]['Subject'], '[gcc/gcc-9] Fix the thing')
+        # The window's timer went with it.
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_pending_results_survive_restart(self):
+        self.add(self.notifier(), 'B1', 'failure')
+        self.clock.advance(400)
+        # As after a restart, with the old notifier gone.
+        for call in self.clock.getDelayedCalls():
+            call.cancel()
+        digest = self.notifier()
+        self.assertEqual(list(digest.pending), ['abc'])
+        self.add(digest, 'B2', 'success')
+        self.clock.advance(199)
+        self.assertEqual(self.sent, [])
+        self.clock.advance(1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertIn('1 of 2 builder(s) failed: B1',
+                      self.sent[0].get_payload())
+        self.assertEqual(self.notifier().pending, {})
+
+    def test_later_digests_reply_to_the_first(self):
+        digest = self.notifier()
+        self.add(digest, 'B1', 'success')
+        digest.flush('abc')
+        self.add(digest, 'B1', 'failure')
+        digest.flush('abc')
+        self.add(self.notifier(), 'B1', 'success')
+        self.clock.advance(600)
+        ids = [mail['Message-Id'] for mail in self.sent]
+        self.assertEqual(len(set(ids)), 3)
+        self.assertIsNone(self.sent[0]['In-Reply-To'])
+        for mail in self.sent[1:]:
+            self.assertEqual(mail['In-Reply-To'], ids[0])
+            self.assertEqual(mail['References'], ids[0])
+
+    def test_threads_are_bounded(self):
+        digest = self.notifier()
+        digest.MAX_THREADS = 2
+        for revision in ('r1', 'r2', 'r3'):
+            self.add(digest, 'B1', 'success', revision=revision)
+            digest.flush(revision)
+        self.assertEqual(list(digest.threads), ['r2', 'r3'])
+
+    def test_without_statepath(self):
+        digest = self.notifier(statepath=None)
+        self.add(digest, 'B1', 'success')
+        digest.flush_all()
+        self.assertEqual(len(self.sent), 1)
+        self.assertFalse(os.path.exists(self.statepath))
+
+
+if __name__ == '__main__':
+    unittest.main()
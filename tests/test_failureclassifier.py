@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from failureclassifier import (FailureClassifier, FailureObserver,
+                               load_signatures)
+
+
+class FakeStep:
+    """
+    The bits of a build step that FailureObserver uses, with the build
+    properties shared between steps.
+    """
+    def __init__(self, name, properties):
+        self.name = name
+        self.properties = properties
+
+    def getProperty(self, name, default=None):
+        return self.properties.get(name, default)
+
+    def setProperty(self, name, value, source):
+        self.properties[name] = value
+
+
+class FailureClassifierTest(unittest.TestCase):
+    def test_default_signatures(self):
+        matches = FailureClassifier().feed([
+            'make[2]: *** [foo.o] Error 1',
+            'cc1: error: No space left on device',
+            "riscv32-unknown-elf-gcc: internal compiler error: Segmentation fault",
+            'collect2: error: ld returned 1 exit status',
+            'write error: No space left on device',
+        ])
+        self.assertEqual(sorted(matches), ['enospc', 'ice', 'linker-error'])
+        self.assertEqual(matches['enospc']['count'], 2)
+        self.assertEqual(matches['enospc']['example'],
+                         'cc1: error: No space left on device')
+
+    def test_no_match(self):
+        self.assertEqual(FailureClassifier().feed(['all good']), {})
+
+    def test_several_signatures_on_one_line(self):
+        matches = FailureClassifier().feed(
+            ['internal compiler error: No space left on device'])
+        self.assertEqual(sorted(matches), ['enospc', 'ice'])
+
+    def test_example_is_bounded(self):
+        matches = FailureClassifier().feed(
+            ['ENOSPC ' + 'x' * 10000])
+        self.assertEqual(len(matches['enospc']['example']), 300)
+
+    def test_load_signatures(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'signatures.json')
+        with open(path, 'w') as f:
+            json.dump([{'name': 'flaky', 'pattern': r'timeout \d+s'},
+                       {'name': 'gone', 'pattern': 'vanished',
+                        'description': 'file vanished'}], f)
+        signatures = load_signatures(path)
+        self.assertEqual(signatures[0].description, 'flaky')
+        matches = FailureClassifier(signatures).feed(
+            ['timeout 300s', 'No space left on device', 'it vanished'])
+        self.assertEqual(sorted(matches), ['flaky', 'gone'])
+        self.assertEqual(matches['gone']['description'], 'file vanished')
+
+
+class FailureObserverTest(unittest.TestCase):
+    def observe(self, name, lines, properties):
+        observer = FailureObserver()
+        observer.step = FakeStep(name, properties)
+        for line in lines:
+            observer.outLineReceived(line)
+        observer.publish()
+
+    def test_publish(self):
+        properties = {}
+        self.observe('compile gcc', ['No space left on device'], properties)
+        self.assertEqual(properties['failure_classified_steps'],
+                         ['compile gcc'])
+        enospc = properties['failure_classification']['enospc']
+        self.assertEqual(enospc['steps'], ['compile gcc'])
+        self.assertEqual(enospc['count'], 1)
+
+    def test_nothing_found(self):
+        properties = {}
+        self.observe('compile gcc', ['all good'], properties)
+        self.assertEqual(properties['failure_classified_steps'],
+                         ['compile gcc'])
+        self.assertNotIn('failure_classification', properties)
+
+    def test_merges_steps(self):
+        properties = {}
+        self.observe('build', ['No space left on device'], properties)
+        self.observe('check', ['fine'], properties)
+        self.observe('install', ['ENOSPC', 'internal compiler error'],
+                     properties)
+        self.assertEqual(properties['failure_classified_steps'],
+                         ['build', 'check', 'install'])
+        classification = properties['failure_classification']
+        self.assertEqual(classification['enospc']['steps'],
+                         ['build', 'install'])
+        self.assertEqual(classification['enospc']['count'], 2)
+        self.assertEqual(classification['ice']['steps'], ['install'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from logaccess import search_log, tail_log
+
+
+class ChunkedLog:
+    """
+    A log that hands out its text in chunks of the given size.
+    """
+    STDOUT = 1
+    STDERR = 2
+
+    def __init__(self, text, size):
+        self.text = text
+        self.size = size
+
+    def getChunks(self, channels, onlyText=False):
+        for start in range(0, len(self.text), self.size):
+            yield self.text[start:start + self.size]
+
+
+class TextLog:
+    def __init__(self, text):
+        self.text = text
+
+    def getText(self):
+        return self.text
+
+
+class SearchLogTest(unittest.TestCase):
+    def test_across_chunks(self):
+        log = ChunkedLog('x' * 100 + 'No space left on device' + 'y' * 100,
+                         size=7)
+        self.assertEqual(search_log(log, 'No space left on device'),
+                         'No space left on device')
+
+    def test_first_needle_found(self):
+        log = ChunkedLog('aaa ENOSPC bbb', size=4)
+        self.assertEqual(search_log(log, ['No space left', 'ENOSPC']),
+                         'ENOSPC')
+        self.assertIsNone(search_log(log, ['missing']))
+
+    def test_text_only_log(self):
+        self.assertEqual(search_log(TextLog('oh ENOSPC'), 'ENOSPC'), 'ENOSPC')
+
+
+class TailLogTest(unittest.TestCase):
+    def test_small_log_is_whole(self):
+        self.assertEqual(tail_log(ChunkedLog('a\nb\n', 1), max_chars=10),
+                         ('a\nb\n', False))
+
+    def test_big_log_is_tailed(self):
+        text = ''.join('line {}\n'.format(i) for i in range(1000))
+        tail, truncated = tail_log(ChunkedLog(text, 100), max_lines=3,
+                                   max_chars=500)
+        self.assertTrue(truncated)
+        self.assertEqual(tail, 'line 998\nline 999\n')
+
+    def test_long_lines_are_cut(self):
+        tail, truncated = tail_log(ChunkedLog('x' * 5000, 64), max_lines=3,
+                                   max_chars=100)
+        self.assertTrue(truncated)
+        self.assertEqual(tail, 'x' * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
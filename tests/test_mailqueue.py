@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from mailqueue import MailQueue
+
+
+class FakeSMTP:
+    """
+    Stands in for smtplib.SMTP.  Each sendmail() takes the next of
+    replies: None to accept the message, a dict of refused recipients,
+    or an exception to raise.
+    """
+    replies = []
+    sent = []
+    connections = 0
+
+    def __init__(self, host, port, timeout=None):
+        FakeSMTP.connections += 1
+
+    def sendmail(self, sender, recipients, message):
+        reply = FakeSMTP.replies.pop(0) if FakeSMTP.replies else None
+        if isinstance(reply, Exception):
+            raise reply
+        FakeSMTP.sent.append((sender, list(recipients), message))
+        return reply or {}
+
+    def noop(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+class MailQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        FakeSMTP.replies = []
+        FakeSMTP.sent = []
+        FakeSMTP.connections = 0
+        patcher = mock.patch('smtplib.SMTP', FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = MailQueue(self.tmpdir, max_rate=0, backoff=10)
+
+    def failed(self):
+        return [name for name in os.listdir(self.queue.faileddir)]
+
+    def entry(self, msgid):
+        with open(os.path.join(self.tmpdir, msgid + '.msg')) as f:
+            return json.load(f)
+
+    def test_enqueue_spools(self):
+        msgid = self.queue.enqueue('a@b', ['c@d'], 'Subject: x\n\nbody\n')
+        self.assertEqual(self.queue.pending(), [msgid])
+        self.assertEqual(self.entry(msgid)['recipients'], ['c@d'])
+        # A new queue on the same spool picks it up.
+        self.assertEqual(MailQueue(self.tmpdir).pending(), [msgid])
+
+    def test_delivers_over_one_connection(self):
+        for i in range(3):
+            self.queue.enqueue('a@b', ['c@d'], 'message {}'.format(i))
+        self.assertIsNone(self.queue.run_once())
+        self.assertEqual([message for _, _, message in FakeSMTP.sent],
+                         ['message 0', 'message 1', 'message 2'])
+        self.assertEqual(FakeSMTP.connections, 1)
+        self.assertEqual(self.queue.pending(), [])
+        self.assertEqual(self.queue.sent, 3)
+
+    def test_unreachable_server_backs_off(self):
+        msgid = self.queue.enqueue('a@b', ['c@d'], 'message')
+        FakeSMTP.replies = [ConnectionRefusedError()]
+        due = self.queue.run_once()
+        self.assertGreater(due, time.time())
+        self.assertEqual(self.entry(msgid)['attempts'], 1)
+        # Not due yet.
+        self.queue.run_once()
+        self.assertEqual(FakeSMTP.sent, [])
+        self.assertEqual(self.queue.pending(), [msgid])
+
+    def test_gives_up_after_max_attempts(self):
+        queue = MailQueue(self.tmpdir, max_rate=0, max_attempts=2, backoff=0)
+        msgid = queue.enqueue('a@b', ['c@d'], 'message')
+        FakeSMTP.replies = [OSError('down'), OSError('down')]
+        queue.run_once()
+        queue.run_once()
+        self.assertEqual(queue.pending(), [])
+        self.assertEqual(self.failed(), [msgid + '.msg'])
+
+    def test_permanent_rejection_fails_at_once(self):
+        msgid = self.queue.enqueue('a@b', ['c@d'], 'message')
+        FakeSMTP.replies = [smtplib.SMTPDataError(554, b'spam')]
+        self.queue.run_once()
+        self.assertEqual(self.failed(), [msgid + '.msg'])
+
+    def test_temporary_rejection_is_retried(self):
+        msgid = self.queue.enqueue('a@b', ['c@d'], 'message')
+        FakeSMTP.replies = [smtplib.SMTPDataError(451, b'later')]
+        self.queue.run_once()
+        self.assertEqual(self.queue.pending(), [msgid])
+        self.assertEqual(self.entry(msgid)['attempts'], 1)
+
+    def test_refused_recipients(self):
+        msgid = self.queue.enqueue('a@b', ['ok@d', 'later@d', 'never@d'],
+                                   'message')
+        FakeSMTP.replies = [{'later@d': (450, b'busy'),
+                             'never@d': (550, b'no such user')}]
+        self.queue.run_once()
+        entry = self.entry(msgid)
+        # Only the temporarily refused recipient is tried again.
+        self.assertEqual(entry['recipients'], ['later@d'])
+        self.assertEqual(entry['refused']['never@d'], [550, 'no such user'])
+
+    def test_all_recipients_refused(self):
+        msgid = self.queue.enqueue('a@b', ['never@d'], 'message')
+        FakeSMTP.replies = [smtplib.SMTPRecipientsRefused(
+            {'never@d': (550, b'no such user')})]
+        self.queue.run_once()
+        self.assertEqual(self.failed(), [msgid + '.msg'])
+
+    def test_broken_entry_doesnt_block_the_rest(self):
+        bad = self.queue.enqueue('a@b', ['c@d'], 'bad')
+        with open(os.path.join(self.tmpdir, bad + '.msg'), 'w') as f:
+            json.dump({'sender': 'a@b'}, f)
+        self.queue.enqueue('a@b', ['c@d'], 'good')
+        with self.assertLogs('mailqueue', 'ERROR'):
+            self.queue.run_once()
+        self.assertEqual([message for _, _, message in FakeSMTP.sent],
+                         ['good'])
+        self.assertEqual(self.failed(), [bad + '.msg'])
+        self.assertEqual(self.queue.pending(), [])
+
+    def test_thread_delivers_and_stops(self):
+        self.queue.start()
+        self.addCleanup(self.queue.stop, 5)
+        self.queue.enqueue('a@b', ['c@d'], 'message')
+        deadline = time.time() + 5
+        while self.queue.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.queue.pending(), [])
+        self.queue.stop(5)
+        self.assertIsNone(self.queue.thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from notifystate import NotificationState
+
+
+class NotificationStateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'notifications.db')
+
+    def open(self, **kwargs):
+        state = NotificationState(self.path, **kwargs)
+        self.addCleanup(state.close)
+        return state
+
+    def test_check_and_set(self):
+        state = self.open()
+        self.assertFalse(state.contains('root:abc'))
+        self.assertTrue(state.check_and_set('root:abc'))
+        self.assertFalse(state.check_and_set('root:abc'))
+        self.assertTrue(state.contains('root:abc'))
+        self.assertTrue(state.check_and_set('root:def'))
+
+    def test_discard(self):
+        state = self.open()
+        state.check_and_set('breakage:B')
+        state.discard('breakage:B')
+        self.assertFalse(state.contains('breakage:B'))
+        self.assertTrue(state.check_and_set('breakage:B'))
+        state.discard('never set')
+
+    def test_persists(self):
+        self.open().check_and_set('root:abc')
+        self.assertFalse(self.open().check_and_set('root:abc'))
+
+    def test_expiry(self):
+        state = self.open(ttl=100)
+        with mock.patch('time.time', return_value=1000.0):
+            self.assertTrue(state.check_and_set('root:abc'))
+        with mock.patch('time.time', return_value=1050.0):
+            self.assertTrue(state.contains('root:abc'))
+            self.assertFalse(state.check_and_set('root:abc'))
+        with mock.patch('time.time', return_value=1101.0):
+            self.assertFalse(state.contains('root:abc'))
+            # An expired key is recorded afresh.
+            self.assertTrue(state.check_and_set('root:abc'))
+            self.assertFalse(state.check_and_set('root:abc'))
+
+    def test_evict(self):
+        state = self.open(ttl=100, max_entries=3)
+        for i in range(5):
+            with mock.patch('time.time', return_value=1000.0 + i):
+                state.check_and_set('key{}'.format(i))
+        with mock.patch('time.time', return_value=1010.0):
+            state.evict()
+            self.assertEqual([state.contains('key{}'.format(i))
+                              for i in range(5)],
+                             [False, False, True, True, True])
+        with mock.patch('time.time', return_value=1103.5):
+            state.evict()
+        count = state.db.execute('SELECT COUNT(*) FROM sent').fetchone()[0]
+        self.assertEqual(count, 1)
+
+    def test_one_winner_between_connections(self):
+        states = [self.open() for _ in range(4)]
+        results = []
+
+        def claim(state):
+            results.append(state.check_and_set('root:abc'))
+
+        threads = [threading.Thread(target=claim, args=(state,))
+                   for state in states]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
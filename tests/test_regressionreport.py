@@ -0,0 +1,77 @@
+import unittest
+
+from regressionreport import RegressionReport, map_test_paths_to_exp
+
+SUM_TEXT = """\
+Running /src/gcc/testsuite/gcc.dg/vect/vect.exp ...
+PASS: gcc.dg/vect/pr1.c (test for excess errors)
+FAIL: gcc.dg/vect/pr2.c execution test
+Running /src/gcc/testsuite/gcc.target/riscv/riscv.exp ...
+FAIL: gcc.target/riscv/rvv/a.c scan-assembler vsetvli
+"""
+
+
+class MapTestPathsTest(unittest.TestCase):
+    def test_map(self):
+        self.assertEqual(map_test_paths_to_exp(SUM_TEXT), {
+            'gcc.dg/vect/pr1.c': 'gcc.dg/vect/vect.exp',
+            'gcc.dg/vect/pr2.c': 'gcc.dg/vect/vect.exp',
+            'gcc.target/riscv/rvv/a.c': 'gcc.target/riscv/riscv.exp'})
+
+    def test_results_before_any_exp(self):
+        self.assertEqual(map_test_paths_to_exp('PASS: gcc.dg/a.c\n'), {})
+
+
+class RegressionReportTest(unittest.TestCase):
+    REPORT = """\
+PASS -> FAIL: gcc.dg/vect/pr1.c (test for excess errors)
+new FAIL: gcc.dg/vect/pr2.c execution test
+PASS -> FAIL: gcc.target/riscv/rvv/a.c scan-assembler vsetvli
+PASS -> FAIL: gcc.dg/torture/b.c -O2
+something without a path
+
+"""
+
+    def test_groups_by_exp(self):
+        report = RegressionReport(self.REPORT, SUM_TEXT)
+        self.assertEqual(len(report), 5)
+        self.assertFalse(report.is_truncated())
+        self.assertEqual(dict(report.groups['gcc.dg/vect/vect.exp']),
+                         {'PASS -> FAIL': 1, 'new FAIL': 1})
+        self.assertEqual(dict(report.groups['gcc.target/riscv/riscv.exp']),
+                         {'PASS -> FAIL': 1})
+        # Not in the .sum, so grouped by directory.
+        self.assertEqual(dict(report.groups['gcc.dg/torture']),
+                         {'PASS -> FAIL': 1})
+        self.assertEqual(dict(report.groups['(other)']), {'changed': 1})
+
+    def test_groups_by_directory_without_sum(self):
+        report = RegressionReport(self.REPORT)
+        self.assertEqual(sorted(report.groups),
+                         ['(other)', 'gcc.dg/torture', 'gcc.dg/vect',
+                          'gcc.target/riscv/rvv'])
+
+    def test_summary_is_bounded(self):
+        report = ''.join('PASS -> FAIL: dir{}/t{}.c\n'.format(i % 100, i)
+                         for i in range(10000))
+        summary = RegressionReport(report, max_details=20, max_groups=5)
+        self.assertTrue(summary.is_truncated())
+        text = summary.summary()
+        lines = text.splitlines()
+        self.assertEqual(lines[0], '10000 changes in 100 groups')
+        self.assertIn('   ... and 95 more groups', lines)
+        self.assertEqual(lines[-1],
+                         '... and 9980 more changes; see the full report')
+        self.assertLess(len(lines), 40)
+
+    def test_summary_largest_group_first(self):
+        report = ('PASS -> FAIL: a/x.c\n'
+                  'PASS -> FAIL: b/x.c\n'
+                  'PASS -> FAIL: b/y.c\n')
+        lines = RegressionReport(report).summary().splitlines()
+        self.assertEqual(lines[2], '     2 b  (PASS -> FAIL: 2)')
+        self.assertEqual(lines[3], '     1 a  (PASS -> FAIL: 1)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import dejagnu
+from dejagnu import parse_columns, parse_columns_text
+from resultcache import ResultsCache
+
+SUM_TEXT = ('PASS: gcc.dg/pr1.c (test for excess errors)\n'
+            'FAIL: gcc.dg/pr2.c execution test\n'
+            'noise\n'
+            'XFAIL: gcc.dg/pr3.c caf\xe9\n')
+
+
+class ResultsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cachedir = os.path.join(self.tmpdir, 'cache')
+        self.cache = ResultsCache(self.cachedir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def cached_files(self):
+        return sorted(os.listdir(self.cachedir))
+
+    def test_encode_decode(self):
+        columns = parse_columns_text(SUM_TEXT)
+        self.assertEqual(self.cache._decode(self.cache._encode(columns)),
+                         columns)
+
+    def test_decode_empty(self):
+        columns = parse_columns_text('')
+        self.assertEqual(self.cache._decode(self.cache._encode(columns)),
+                         columns)
+
+    def test_decode_rejects_garbage(self):
+        data = self.cache._encode(parse_columns_text(SUM_TEXT))
+        self.assertIsNone(self.cache._decode(b''))
+        self.assertIsNone(self.cache._decode(b'XXXXXXXX' + data[8:]))
+        self.assertIsNone(self.cache._decode(data[:-3]))
+
+    def test_miss_then_hit(self):
+        path = self.write('gcc.sum', SUM_TEXT)
+        self.assertIsNone(self.cache.load(path))
+        columns = self.cache.get_columns(path)
+        self.assertEqual(columns, parse_columns(path))
+        self.assertEqual(self.cache.load(path), columns)
+
+    def test_changed_file_misses(self):
+        path = self.write('gcc.sum', SUM_TEXT)
+        self.cache.get_columns(path)
+        self.write('gcc.sum', 'PASS: other\n')
+        self.assertIsNone(self.cache.load(path))
+        self.assertEqual(self.cache.get_columns(path)[0], ['other'])
+
+    def test_identical_files_share_an_entry(self):
+        a = self.write('a.sum', SUM_TEXT)
+        b = self.write('b.sum', SUM_TEXT)
+        self.cache.get_columns(a)
+        self.cache.get_columns(b)
+        files = self.cached_files()
+        self.assertEqual(len([f for f in files if f.endswith('.res')]), 1)
+        self.assertEqual(len([f for f in files if f.endswith('.ref')]), 2)
+
+    def test_text_columns_share_file_entries(self):
+        path = self.write('gcc.sum', SUM_TEXT)
+        self.cache.get_columns(path)
+        self.assertEqual(self.cache.get_text_columns(SUM_TEXT),
+                         parse_columns_text(SUM_TEXT))
+        self.assertEqual(len([f for f in self.cached_files()
+                              if f.endswith('.res')]), 1)
+
+    def test_invalid_utf8_decodes_as_parser(self):
+        path = os.path.join(self.tmpdir, 'gcc.sum')
+        with open(path, 'wb') as f:
+            f.write(b'PASS: bad \xff byte\n')
+        self.assertEqual(self.cache.get_columns(path), parse_columns(path))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultsCache(self.cachedir, max_bytes=1)
+        path = self.write('gcc.sum', SUM_TEXT)
+        cache.get_columns(path)
+        # Everything is over the limit, so nothing is kept.
+        self.assertEqual(self.cached_files(), [])
+        self.assertEqual(cache.size, 0)
+
+    def test_eviction_keeps_recent_files(self):
+        old = os.path.join(self.cachedir, 'old.res')
+        with open(old, 'wb') as f:
+            f.write(b'x' * 1000)
+        os.utime(old, (0, 0))
+        cache = ResultsCache(self.cachedir, max_bytes=1050)
+        cache.get_columns(self.write('gcc.sum', SUM_TEXT))
+        files = self.cached_files()
+        self.assertNotIn('old.res', files)
+        self.assertEqual(len(files), 2)
+
+    def test_eviction_leaves_temporary_files(self):
+        tmp = os.path.join(self.cachedir, 'x.res.abc.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(b'x' * 1000)
+        ResultsCache(self.cachedir, max_bytes=10).evict()
+        self.assertEqual(self.cached_files(), ['x.res.abc.tmp'])
+
+    def test_sumfile_uses_installed_cache(self):
+        path = self.write('gcc.sum', SUM_TEXT)
+        dejagnu.set_results_cache(self.cache)
+        self.addCleanup(dejagnu.set_results_cache, None)
+        sumfile = dejagnu.SumFile(path, lazy=True)
+        self.assertEqual(len(sumfile.testname_to_outcome), 3)
+        self.assertIsNotNone(self.cache.load(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from resultsgit import GitResultsWriter, ResultsBatch
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class GitResultsWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.writer = GitResultsWriter.init_bare(
+            os.path.join(self.tmpdir, 'results.git'))
+
+    def files(self, branch):
+        out = self.writer.git('ls-tree', '-r', '--name-only', branch)
+        return sorted(out.decode('utf-8').splitlines())
+
+    def test_commit_creates_branch(self):
+        self.assertIsNone(self.writer.resolve('B/master'))
+        commit = self.writer.commit('B/master', {'gcc.sum': b'PASS: a\n',
+                                                 'xfails/xfail': b'x\n'},
+                                    'first')
+        self.assertEqual(self.writer.resolve('B/master'), commit)
+        self.assertEqual(self.writer.read('B/master', 'gcc.sum'),
+                         b'PASS: a\n')
+        self.assertEqual(self.files('B/master'), ['gcc.sum', 'xfails/xfail'])
+
+    def test_commit_on_top(self):
+        first = self.writer.commit('B/master', {'gcc.sum': b'PASS: a\n'},
+                                   'first')
+        second = self.writer.commit('B/master', {'gcc.sum': b'FAIL: a\n',
+                                                 'a/b/c': b'c\n'}, 'second')
+        parent = self.writer.git('rev-parse', second + '^')
+        self.assertEqual(parent.decode('ascii').strip(), first)
+        self.assertEqual(self.writer.read('B/master', 'gcc.sum'),
+                         b'FAIL: a\n')
+        self.assertEqual(self.files('B/master'), ['a/b/c', 'gcc.sum'])
+
+    def test_delete_prunes_empty_trees(self):
+        self.writer.commit('B/master', {'gcc.sum': b'PASS: a\n',
+                                        'reports/a/regressions': b'r\n'},
+                           'first')
+        self.writer.commit('B/master', {'reports/a/regressions': None,
+                                        'missing': None}, 'second')
+        self.assertEqual(self.files('B/master'), ['gcc.sum'])
+
+    def test_unchanged_commit_is_skipped(self):
+        first = self.writer.commit('B/master', {'gcc.sum': b'PASS: a\n'},
+                                   'first')
+        self.assertEqual(self.writer.commit('B/master',
+                                            {'gcc.sum': b'PASS: a\n'},
+                                            'again'),
+                         first)
+
+    def test_branches_are_separate(self):
+        self.writer.commit('B/master', {'gcc.sum': b'master\n'}, 'm')
+        self.writer.commit('B/gcc-9', {'gcc.sum': b'gcc-9\n'}, 'g')
+        self.assertEqual(self.writer.read('B/master', 'gcc.sum'), b'master\n')
+        self.assertEqual(self.writer.read('B/gcc-9', 'gcc.sum'), b'gcc-9\n')
+
+    def test_copy_sees_earlier_ops(self):
+        self.writer.commit('B/master', {'gcc.sum': b'old\n'}, 'first')
+        blob = self.writer.write_blob(b'new\n')
+        self.writer.commit_ops('B/master',
+                               [('copy', 'gcc.sum', 'previous_gcc.sum'),
+                                ('write', 'gcc.sum', blob),
+                                ('copy', 'gcc.sum', 'baseline'),
+                                ('copy', 'missing', 'nothing')], 'second')
+        self.assertEqual(self.writer.read('B/master', 'previous_gcc.sum'),
+                         b'old\n')
+        self.assertEqual(self.writer.read('B/master', 'baseline'), b'new\n')
+        self.assertIsNone(self.writer.read('B/master', 'nothing'))
+
+    def test_retries_when_branch_moves(self):
+        writer = self.writer
+        writer.commit('B/master', {'a': b'a\n'}, 'first')
+        other = GitResultsWriter(writer.repodir)
+        real_resolve = writer.resolve
+        moved = []
+
+        def resolve(branch):
+            parent = real_resolve(branch)
+            if not moved:
+                # Another writer gets in between.
+                moved.append(other.commit(branch, {'b': b'b\n'}, 'other'))
+            return parent
+
+        writer.resolve = resolve
+        commit = writer.commit('B/master', {'c': b'c\n'}, 'mine')
+        parent = writer.git('rev-parse', commit + '^')
+        self.assertEqual(parent.decode('ascii').strip(), moved[0])
+        self.assertEqual(self.files('B/master'), ['a', 'b', 'c'])
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class ResultsBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.writer = GitResultsWriter.init_bare(
+            os.path.join(self.tmpdir, 'results.git'))
+
+    def test_one_commit_per_batch(self):
+        self.writer.commit('B/master', {'gcc.sum': b'PASS: a\n'}, 'first')
+        path = os.path.join(self.tmpdir, 'xfail')
+        with open(path, 'wb') as f:
+            f.write(b'xfail\n')
+        with ResultsBatch(self.writer, 'B/master', 'build 2') as batch:
+            batch.promote('gcc.sum', 'previous_gcc.sum')
+            batch.add('gcc.sum', 'FAIL: caf\xe9\n')
+            batch.add_file('xfails/xfail', path)
+            batch.delete('reports/regressions')
+        count = self.writer.git('rev-list', '--count', 'B/master')
+        self.assertEqual(int(count), 2)
+        self.assertEqual(self.writer.read('B/master', 'previous_gcc.sum'),
+                         b'PASS: a\n')
+        self.assertEqual(self.writer.read('B/master', 'gcc.sum'),
+                         'FAIL: caf\xe9\n'.encode('utf-8'))
+        self.assertEqual(self.writer.read('B/master', 'xfails/xfail'),
+                         b'xfail\n')
+        self.assertEqual(batch.commit(), self.writer.resolve('B/master'))
+
+    def test_discarded_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with ResultsBatch(self.writer, 'B/master', 'build') as batch:
+                batch.add('gcc.sum', 'PASS: a\n')
+                raise RuntimeError
+        self.assertIsNone(self.writer.resolve('B/master'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from resultstore import (ResultsStore, SUM, PREVIOUS_SUM, BASELINE,
+                         TRY_SUM)
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.store = ResultsStore(self.tmpdir)
+
+    def objects(self):
+        return [os.path.join(directory, name)
+                for directory, _, names in os.walk(
+                    os.path.join(self.tmpdir, 'objects'))
+                for name in names]
+
+    def test_write_read(self):
+        digest = self.store.write('B', 'master', SUM, 'PASS: caf\xe9\n')
+        self.assertEqual(self.store.get_ref('B', 'master', SUM), digest)
+        self.assertEqual(self.store.read('B', 'master', SUM),
+                         'PASS: caf\xe9\n')
+
+    def test_missing(self):
+        self.assertIsNone(self.store.get_ref('B', 'master', SUM))
+        self.assertIsNone(self.store.read('B', 'master', SUM))
+        self.assertFalse(self.store.promote('B', 'master', SUM, BASELINE))
+        self.assertIsNone(self.store.get_ref('B', 'master', BASELINE))
+
+    def test_content_is_stored_once(self):
+        self.store.write('B', 'master', SUM, 'PASS: a\n')
+        self.store.write('B', 'gcc-9', SUM, 'PASS: a\n')
+        self.store.write('C', 'master', TRY_SUM, 'PASS: a\n')
+        self.assertEqual(len(self.objects()), 1)
+
+    def test_promote(self):
+        self.store.write('B', 'master', SUM, 'PASS: a\n')
+        self.assertTrue(self.store.promote('B', 'master', SUM, PREVIOUS_SUM))
+        self.store.write('B', 'master', SUM, 'FAIL: a\n')
+        self.assertEqual(self.store.read('B', 'master', PREVIOUS_SUM),
+                         'PASS: a\n')
+        self.assertEqual(self.store.read('B', 'master', SUM), 'FAIL: a\n')
+
+    def test_branches_dont_clash(self):
+        self.store.write('B', 'foo', SUM, 'PASS: foo\n')
+        self.store.write('B', 'foo/bar', SUM, 'PASS: foo/bar\n')
+        self.assertEqual(self.store.read('B', 'foo', SUM), 'PASS: foo\n')
+        self.assertEqual(self.store.read('B', 'foo/bar', SUM),
+                         'PASS: foo/bar\n')
+
+    def test_update_refs(self):
+        old = self.store.write('B', 'master', SUM, 'PASS: a\n')
+        new = self.store.put(b'FAIL: a\n')
+        self.store.update_refs('B', 'master', {SUM: new, PREVIOUS_SUM: old,
+                                               TRY_SUM: None})
+        self.assertEqual(self.store.get_ref('B', 'master', SUM), new)
+        self.assertEqual(self.store.get_ref('B', 'master', PREVIOUS_SUM), old)
+        self.assertIsNone(self.store.get_ref('B', 'master', TRY_SUM))
+        self.assertFalse(os.path.exists(
+            self.store._update_path('B', 'master')))
+
+    def test_interrupted_update_is_finished(self):
+        old = self.store.write('B', 'master', SUM, 'PASS: a\n')
+        new = self.store.put(b'FAIL: a\n')
+        # As if update_refs had stopped after writing its update file.
+        with open(self.store._update_path('B', 'master'), 'w') as f:
+            json.dump({SUM: new, BASELINE: old}, f)
+        store = ResultsStore(self.tmpdir)
+        self.assertEqual(store.get_ref('B', 'master', BASELINE), old)
+        self.assertEqual(store.get_ref('B', 'master', SUM), new)
+        self.assertFalse(os.path.exists(store._update_path('B', 'master')))
+
+    def test_torn_update_file_is_dropped(self):
+        old = self.store.write('B', 'master', SUM, 'PASS: a\n')
+        with open(self.store._update_path('B', 'master'), 'w') as f:
+            f.write('{"gcc.sum": "ab')
+        self.assertEqual(self.store.get_ref('B', 'master', SUM), old)
+        self.assertFalse(os.path.exists(
+            self.store._update_path('B', 'master')))
+
+    def test_ref_file_is_replaced(self):
+        self.store.write('B', 'master', SUM, 'PASS: a\n')
+        path = self.store.ref_path('B', 'master', SUM)
+        before = os.stat(path).st_ino
+        self.store.write('B', 'master', SUM, 'FAIL: a\n')
+        self.assertNotEqual(os.stat(path).st_ino, before)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path))
+                          if name.endswith('.tmp')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
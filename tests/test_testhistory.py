@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from dejagnu import TestRun
+from testhistory import HistoryStore
+
+
+def run(**sums):
+    """
+    A TestRun of gcc.sum and g++.sum, from their texts.
+    """
+    return TestRun.from_sum_texts(
+        dict((name.replace('_', '+') + '.sum', text)
+             for name, text in sums.items()))
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'history')
+
+    def record_builds(self, store):
+        store.record('1', run(gcc='PASS: a\nPASS: b\n'))
+        store.record('2', run(gcc='FAIL: a\nPASS: b\n'))
+        store.record('3', run(gcc='FAIL: a\nPASS: b\nPASS: c\n',
+                              g__='PASS: a\n'))
+        store.record('4', run(gcc='FAIL: a\nFAIL: b\n'))
+
+    def test_empty(self):
+        store = HistoryStore(self.path)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.timeline('gcc.sum', 'a'), [])
+        self.assertIsNone(store.first_failing('gcc.sum', 'a'))
+
+    def test_timeline(self):
+        store = HistoryStore(self.path)
+        self.record_builds(store)
+        self.assertEqual(store.labels(), ['1', '2', '3', '4'])
+        self.assertEqual(store.timeline('gcc.sum', 'a'),
+                         [('1', 'PASS'), ('2', 'FAIL'), ('3', 'FAIL'),
+                          ('4', 'FAIL')])
+        self.assertEqual(store.timeline('gcc.sum', 'c'),
+                         [('1', None), ('2', None), ('3', 'PASS'),
+                          ('4', None)])
+        # The same test name in another .sum is another test.
+        self.assertEqual(store.timeline('g++.sum', 'a'),
+                         [('1', None), ('2', None), ('3', 'PASS'),
+                          ('4', None)])
+        self.assertEqual(store.timeline('gcc.sum', 'unknown'),
+                         [('1', None), ('2', None), ('3', None),
+                          ('4', None)])
+
+    def test_queries(self):
+        store = HistoryStore(self.path)
+        self.record_builds(store)
+        self.assertEqual(store.flip_count('gcc.sum', 'a'), 1)
+        self.assertEqual(store.flip_count('gcc.sum', 'b'), 1)
+        self.assertEqual(store.flip_count('gcc.sum', 'c'), 0)
+        self.assertEqual(store.first_failing('gcc.sum', 'a'), '2')
+        self.assertEqual(store.first_failing('gcc.sum', 'b'), '4')
+        self.assertIsNone(store.first_failing('gcc.sum', 'c'))
+
+    def test_reopen(self):
+        self.record_builds(HistoryStore(self.path))
+        store = HistoryStore(self.path)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.first_failing('gcc.sum', 'a'), '2')
+        store.record('5', run(gcc='PASS: a\nPASS: d\n'))
+        self.assertIsNone(store.first_failing('gcc.sum', 'a'))
+        self.assertEqual(store.timeline('gcc.sum', 'd')[-1], ('5', 'PASS'))
+
+    def test_reader_sees_new_builds(self):
+        writer = HistoryStore(self.path)
+        writer.record('1', run(gcc='PASS: a\n'))
+        reader = HistoryStore(self.path)
+        self.assertEqual(reader.timeline('gcc.sum', 'a'), [('1', 'PASS')])
+
+    def test_torn_lines_are_dropped(self):
+        self.record_builds(HistoryStore(self.path))
+        with open(os.path.join(self.path, 'builds.txt'), 'a') as f:
+            f.write('123 4')
+        with open(os.path.join(self.path, 'names.txt'), 'a') as f:
+            f.write('gcc.sum\tpart')
+        store = HistoryStore(self.path)
+        self.assertEqual(len(store), 4)
+        store.record('5', run(gcc='PASS: e\n'))
+        self.assertEqual(HistoryStore(self.path).timeline('gcc.sum', 'e'),
+                         [('1', None), ('2', None), ('3', None),
+                          ('4', None), ('5', 'PASS')])
+
+    def test_failed_record_leaves_no_trace(self):
+        store = HistoryStore(self.path)
+        store.record('1', run(gcc='PASS: a\n'))
+        real_open = open
+
+        def failing_open(path, mode='r', *args, **kwargs):
+            # Appending the build line fails; cutting it back doesn't.
+            if path == store.builds_path and mode == 'a':
+                raise OSError('disk full')
+            return real_open(path, mode, *args, **kwargs)
+
+        with mock.patch('builtins.open', failing_open):
+            self.assertRaises(OSError, store.record, '2',
+                              run(gcc='PASS: a\nPASS: new\n'))
+        self.assertEqual(store.labels(), ['1'])
+        self.assertNotIn('gcc.sum\tnew', store.key_to_id)
+        reopened = HistoryStore(self.path)
+        self.assertEqual(reopened.labels(), ['1'])
+        self.assertEqual(len(reopened.key_to_id), 1)
+
+    def test_label_must_be_one_line(self):
+        store = HistoryStore(self.path)
+        self.assertRaises(ValueError, store.record, '1\n2',
+                          run(gcc='PASS: a\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from tryjobindex import TryJobAddressIndex
+
+
+class TryJobAddressIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.jobdir = os.path.join(self.tmpdir, 'jobdir')
+        for subdir in ('new', 'cur'):
+            os.makedirs(os.path.join(self.jobdir, subdir))
+        self.tick = 10 ** 18
+
+    def job(self, subdir, name, text):
+        """
+        Write a job file, giving it and its directory an mtime later
+        than any before, however coarse the filesystem's clock.
+        """
+        self.tick += 10 ** 9
+        path = os.path.join(self.jobdir, subdir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        os.utime(path, ns=(self.tick, self.tick))
+        os.utime(os.path.dirname(path), ns=(self.tick, self.tick))
+        return path
+
+    def test_lookup(self):
+        self.job('cur', '1', '3:foo,19:Jane Doe <jane@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        self.assertTrue(index.update())
+        self.assertEqual(index.lookup('Jane Doe'),
+                         'Jane Doe <jane@example.com>')
+        self.assertIsNone(index.lookup('Nobody'))
+
+    def test_newer_job_wins(self):
+        self.job('cur', '1', 'Jane Doe <old@example.com>,')
+        self.job('cur', '2', 'Jane Doe <new@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        index.update()
+        self.assertEqual(index.lookup('Jane Doe'), 'Jane Doe <new@example.com>')
+
+    def test_new_beats_cur(self):
+        self.job('new', '1', 'Jane Doe <new@example.com>,')
+        self.job('cur', '2', 'Jane Doe <cur@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        index.update()
+        self.assertEqual(index.lookup('Jane Doe'), 'Jane Doe <new@example.com>')
+
+    def test_unchanged_directories_are_not_read(self):
+        self.job('cur', '1', 'Jane Doe <jane@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        index.update()
+        with mock.patch('os.scandir') as scandir:
+            self.assertFalse(index.update())
+            scandir.assert_not_called()
+
+    def test_only_new_files_are_read(self):
+        self.job('cur', '1', 'Jane Doe <jane@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        index.update()
+        self.job('cur', '2', 'John Roe <john@example.com>,')
+        read = []
+        real_read_job = index._read_job
+
+        def read_job(path, rank, mtime):
+            read.append(os.path.basename(path))
+            real_read_job(path, rank, mtime)
+
+        index._read_job = read_job
+        self.assertTrue(index.update())
+        self.assertEqual(read, ['2'])
+        self.assertEqual(index.lookup('John Roe'), 'John Roe <john@example.com>')
+
+    def test_saved_index_is_reused(self):
+        self.job('cur', '1', 'Jane Doe <jane@example.com>,')
+        TryJobAddressIndex(self.jobdir).update()
+        index = TryJobAddressIndex(self.jobdir)
+        self.assertEqual(index.lookup('Jane Doe'), 'Jane Doe <jane@example.com>')
+        self.assertFalse(index.update())
+
+    def test_moved_jobs_keep_their_addresses(self):
+        path = self.job('new', '1', 'Jane Doe <jane@example.com>,')
+        index = TryJobAddressIndex(self.jobdir)
+        index.update()
+        os.remove(path)
+        self.job('cur', '1', 'Jane Doe <jane@example.com>,')
+        self.tick += 10 ** 9
+        os.utime(os.path.join(self.jobdir, 'new'), ns=(self.tick, self.tick))
+        index.update()
+        self.assertNotIn(path, index.files)
+        self.assertEqual(index.lookup('Jane Doe'), 'Jane Doe <jane@example.com>')
+
+    def test_corrupt_index_is_rebuilt(self):
+        self.job('cur', '1', 'Jane Doe <jane@example.com>,')
+        with open(os.path.join(self.jobdir, 'address-index.json'), 'w') as f:
+            f.write('{"names": ')
+        index = TryJobAddressIndex(self.jobdir)
+        self.assertTrue(index.update())
+        self.assertEqual(index.lookup('Jane Doe'), 'Jane Doe <jane@example.com>')
+
+
+if __name__ == '__main__':
+    unittest.main()